@@ -2,8 +2,8 @@ import streamlit as st
 import pandas as pd
 import re
 import openai
-from google.oauth2.service_account import Credentials
 import gspread
+from sheets_client import open_first_worksheet
 
 openai.api_key = st.secrets["openai"]["openai_api_key"]
 
@@ -70,12 +70,8 @@ possible_columns = [
 
 @st.cache_data
 def load_google_sheet(sheet_id):
-    credentials_info = st.secrets["google_credentials"]
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    gc = gspread.authorize(credentials)
     try:
-        sheet = gc.open_by_key(sheet_id).sheet1
+        sheet = open_first_worksheet(sheet_id)
         data = pd.DataFrame(sheet.get_all_records())
         return data
     except gspread.SpreadsheetNotFound:
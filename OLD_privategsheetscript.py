@@ -2,8 +2,8 @@ import streamlit as st
 import pandas as pd
 import re
 import anthropic
-from google.oauth2.service_account import Credentials
 import gspread
+from sheets_client import open_first_worksheet
 import time
 from collections import defaultdict
 import logging
@@ -72,16 +72,9 @@ def load_google_sheet(sheet_id):
     """
     Loads data from a Google Sheet, automatically handling duplicate column names.
     """
-    credentials_info = st.secrets["google_credentials"]
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    gc = gspread.authorize(credentials)
     try:
         # Access the first sheet of the specified Google Sheet.
-        sheet = gc.open_by_key(sheet_id).sheet1
+        sheet = open_first_worksheet(sheet_id)
         data = sheet.get_all_values()
         if not data:
             st.warning(f"Google Sheet with ID '{sheet_id}' is empty.")
@@ -326,15 +319,8 @@ def update_google_sheet(sheet_id, job_id, generated_content, source_row, submitt
     Updates the specified Google Sheet with the generated content.
     Also updates Job ID, Submittee Name, Selected Template, and Timestamp.
     """
-    credentials_info = st.secrets["google_credentials"]
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    gc = gspread.authorize(credentials)
     try:
-        sheet = gc.open_by_key(sheet_id).sheet1
+        sheet = open_first_worksheet(sheet_id)
         # Locate Job ID in Column B.
         cell = sheet.find(job_id, in_column=2)
         if not cell:
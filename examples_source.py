@@ -0,0 +1,135 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+
+EXAMPLES_URL = "https://raw.githubusercontent.com/scooter7/videotemplateselectionform/main/Examples/examples.csv"
+BUNDLED_EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Examples", "examples.csv")
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "examples")
+# How often the remote copy is revalidated, and how long one check may take.
+REVALIDATE_INTERVAL_SECONDS = 15 * 60
+REQUEST_TIMEOUT_SECONDS = 10
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+class ExamplesSource:
+    """
+    Serves examples.csv from local disk and keeps it fresh in the background.
+    Reads never touch the network: they use the last good copy fetched from url, kept in cache_dir,
+    or the bundled copy until one has been fetched. A daemon thread revalidates the remote copy every
+    interval seconds with If-None-Match/If-Modified-Since, and replaces the cached copy only when a
+    changed file parses as a template CSV.
+    """
+
+    def __init__(self, url=EXAMPLES_URL, bundled_path=BUNDLED_EXAMPLES_PATH, cache_dir=DEFAULT_CACHE_DIR, interval=REVALIDATE_INTERVAL_SECONDS):
+        self.url = url
+        self.bundled_path = bundled_path
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.csv_path = os.path.join(cache_dir, "examples.csv")
+        self.meta_path = os.path.join(cache_dir, "examples.json")
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def path(self):
+        return self.csv_path if os.path.exists(self.csv_path) else self.bundled_path
+
+    @property
+    def version(self):
+        """
+        Identifies the local copy reads currently come from; it changes whenever a new copy is cached,
+        so callers can key their own caches on it.
+        """
+        path = self.path
+        try:
+            return f"{path}:{os.stat(path).st_mtime_ns}"
+        except OSError:
+            return path
+
+    def read(self):
+        """
+        Returns examples.csv as a DataFrame, from the cached copy if there is one, else the bundled one.
+        """
+        return pd.read_csv(self.path)
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def revalidate(self):
+        """
+        Asks the remote for a newer copy, sending the validators of the cached one.
+        Returns True if a changed copy was cached, False if the local copy is still current.
+        """
+        with self._lock:
+            headers = {}
+            meta = self._read_meta() if os.path.exists(self.csv_path) else {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            response = requests.get(self.url, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            frame = pd.read_csv(io.BytesIO(response.content))
+            if 'Template' not in frame.columns:
+                raise ValueError(f"{self.url} has no 'Template' column")
+            try:
+                with open(self.path, "rb") as f:
+                    changed = f.read() != response.content
+            except OSError:
+                changed = True
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if changed or not os.path.exists(self.csv_path):
+                # Write to a temporary file first so readers never see a partial copy.
+                temp_path = f"{self.csv_path}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(response.content)
+                os.replace(temp_path, self.csv_path)
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.time()
+                }, f)
+            return changed
+
+    def start(self):
+        """
+        Starts the background revalidation thread; its first check runs straight away.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="examples-revalidator", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.revalidate()
+            except Exception:
+                # Reads keep using the last good copy; the next check tries again.
+                logging.exception("Revalidating %s failed.", self.url)
+            time.sleep(self.interval)
+
+
+def get_examples_source(url=EXAMPLES_URL):
+    """
+    Returns the process-wide source for url, starting its background revalidation on first use.
+    """
+    with _sources_lock:
+        if url not in _sources:
+            _sources[url] = ExamplesSource(url).start()
+        return _sources[url]
@@ -0,0 +1,252 @@
+import collections
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import gspread
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range
+
+# The Sheets API's default per-user limits: 60 read and 60 write requests per minute.
+DEFAULT_READS_PER_MINUTE = 60
+DEFAULT_WRITES_PER_MINUTE = 60
+QUOTA_WINDOW_SECONDS = 60
+
+
+def quota_error(kind):
+    """
+    Returns the APIError gspread raises when the Sheets API answers 429.
+    """
+    error = {
+        "code": 429,
+        "message": f"Quota exceeded for quota metric '{kind.capitalize()} requests' and limit '{kind.capitalize()} requests per minute per user'.",
+        "status": "RESOURCE_EXHAUSTED",
+    }
+    response = SimpleNamespace(status_code=429, text=json.dumps({"error": error}), json=lambda: {"error": error})
+    return gspread.exceptions.APIError(response)
+
+
+class FakeSheetsClient:
+    """
+    In-memory stand-in for a gspread Client, covering the calls this project makes.
+    Every API call sleeps latency seconds and counts against a sliding one-minute quota for its kind,
+    read or write; calls over quota raise the same 429 APIError as the real API.
+    calls counts each method by name, plus "429" for rejected calls.
+    Pass it to sheets_client.use_sheets_client to run the apps against it.
+    """
+
+    def __init__(self, latency=0.0, reads_per_minute=DEFAULT_READS_PER_MINUTE, writes_per_minute=DEFAULT_WRITES_PER_MINUTE, clock=time.monotonic, sleep=time.sleep):
+        self.latency = latency
+        self.quotas = {"read": reads_per_minute, "write": writes_per_minute}
+        self.clock = clock
+        self.sleep = sleep
+        self.spreadsheets = {}
+        self.calls = collections.Counter()
+        self._windows = {"read": collections.deque(), "write": collections.deque()}
+        self._lock = threading.Lock()
+
+    def add_spreadsheet(self, key, rows=None, title="Sheet1"):
+        """
+        Creates a spreadsheet whose first worksheet holds rows, a list of lists of cell values. Makes no API call.
+        """
+        spreadsheet = FakeSpreadsheet(self, key)
+        spreadsheet.add_worksheet(title, rows)
+        self.spreadsheets[key] = spreadsheet
+        return spreadsheet
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            for window in self._windows.values():
+                window.clear()
+
+    def call(self, kind, name):
+        """
+        Accounts for one API request: counts it, enforces the quota and waits out the latency.
+        """
+        with self._lock:
+            self.calls[name] += 1
+            now = self.clock()
+            window = self._windows[kind]
+            while window and now - window[0] >= QUOTA_WINDOW_SECONDS:
+                window.popleft()
+            limit = self.quotas[kind]
+            if limit is not None and len(window) >= limit:
+                self.calls["429"] += 1
+                raise quota_error(kind)
+            window.append(now)
+        if self.latency:
+            self.sleep(self.latency)
+
+    def open_by_key(self, key):
+        self.call("read", "open_by_key")
+        if key not in self.spreadsheets:
+            raise gspread.SpreadsheetNotFound(key)
+        return self.spreadsheets[key]
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, key):
+        self.client = client
+        self.id = key
+        self._worksheets = []
+
+    def add_worksheet(self, title, rows=None):
+        worksheet = FakeWorksheet(self, title, len(self._worksheets), rows)
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    @property
+    def sheet1(self):
+        # gspread fetches the spreadsheet metadata to find the first worksheet, one read request per access.
+        self.client.call("read", "sheet1")
+        return self._worksheets[0]
+
+    def worksheet(self, title):
+        self.client.call("read", "worksheet")
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise gspread.WorksheetNotFound(title)
+
+    def values_batch_update(self, body):
+        """
+        Writes every range in body["data"], each qualified with its worksheet title, as one request.
+        """
+        self.client.call("write", "values_batch_update")
+        targets = []
+        for update in body["data"]:
+            title, _, range_name = update["range"].rpartition("!")
+            title = title[1:-1].replace("''", "'") if title.startswith("'") else title
+            worksheet = next((w for w in self._worksheets if w.title == title), None)
+            if worksheet is None:
+                raise gspread.WorksheetNotFound(title)
+            targets.append((worksheet, range_name, update["values"]))
+        # Like the API, a batch is applied entirely or not at all.
+        for worksheet, range_name, values in targets:
+            worksheet.write_range(range_name, values)
+        return {"spreadsheetId": self.id, "totalUpdatedCells": sum(len(row) for _, _, values in targets for row in values)}
+
+
+class FakeWorksheet:
+    """
+    A worksheet held as a list of rows of strings. Reads return values the way the API does:
+    strings, with trailing empty cells and rows left out.
+    """
+
+    def __init__(self, spreadsheet, title, index, rows=None):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self.id = index
+        self.cells = [[self._text(value) for value in row] for row in rows or []]
+        # Reentrant so append_rows can pick its rows and write them as one step.
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _text(value):
+        return "" if value is None else str(value)
+
+    def _trimmed(self, rows):
+        rows = [list(row) for row in rows]
+        for row in rows:
+            while row and row[-1] == "":
+                row.pop()
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def read_range(self, range_name):
+        grid = a1_range_to_grid_range(range_name)
+        with self._lock:
+            end_row = grid.get("endRowIndex", len(self.cells))
+            rows = self.cells[grid.get("startRowIndex", 0):end_row]
+            start_col = grid.get("startColumnIndex", 0)
+            end_col = grid.get("endColumnIndex")
+            return self._trimmed(row[start_col:end_col] for row in rows)
+
+    def write_range(self, range_name, values):
+        grid = a1_range_to_grid_range(range_name)
+        start_row = grid.get("startRowIndex", 0)
+        start_col = grid.get("startColumnIndex", 0)
+        with self._lock:
+            for r, row in enumerate(values, start=start_row):
+                while len(self.cells) <= r:
+                    self.cells.append([])
+                for c, value in enumerate(row, start=start_col):
+                    while len(self.cells[r]) <= c:
+                        self.cells[r].append("")
+                    self.cells[r][c] = self._text(value)
+
+    def get_all_values(self):
+        self.client.call("read", "get_all_values")
+        with self._lock:
+            return self._trimmed(self.cells)
+
+    def get(self, range_name):
+        self.client.call("read", "get")
+        return self.read_range(range_name)
+
+    def row_values(self, row):
+        self.client.call("read", "row_values")
+        with self._lock:
+            values = list(self.cells[row - 1]) if row <= len(self.cells) else []
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col):
+        self.client.call("read", "col_values")
+        with self._lock:
+            values = [row[col - 1] if col <= len(row) else "" for row in self.cells]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        """
+        Returns the first Cell whose value equals query, scanning row by row, or None.
+        """
+        self.client.call("read", "find")
+        if not case_sensitive:
+            query = query.lower()
+        with self._lock:
+            for r, row in enumerate(self.cells, start=1):
+                if in_row is not None and r != in_row:
+                    continue
+                for c, value in enumerate(row, start=1):
+                    if in_column is not None and c != in_column:
+                        continue
+                    if (value if case_sensitive else value.lower()) == query:
+                        return Cell(r, c, value)
+        return None
+
+    def update_cell(self, row, col, value):
+        self.client.call("write", "update_cell")
+        self.write_range(gspread.utils.rowcol_to_a1(row, col), [[value]])
+
+    def update(self, values, range_name=None, **kwargs):
+        self.client.call("write", "update")
+        self.write_range(range_name or "A1", values)
+
+    def append_rows(self, values, value_input_option="RAW", insert_data_option=None, table_range=None, **kwargs):
+        """
+        Writes values after the last non-empty row, as one request, and returns the range written like the API does.
+        """
+        self.client.call("write", "append_rows")
+        with self._lock:
+            start_row = len(self._trimmed(self.cells)) + 1
+            width = max((len(row) for row in values), default=1)
+            range_name = f"A{start_row}:{gspread.utils.rowcol_to_a1(start_row + len(values) - 1, width)}"
+            quoted_title = self.title.replace("'", "''")
+            self.write_range(range_name, values)
+        return {
+            "spreadsheetId": self.spreadsheet.id,
+            "updates": {"updatedRange": f"'{quoted_title}'!{range_name}", "updatedRows": len(values)}
+        }
+
+    def batch_update(self, data, **kwargs):
+        self.client.call("write", "batch_update")
+        for update in data:
+            self.write_range(update["range"], update["values"])
@@ -0,0 +1,101 @@
+import itertools
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# Same constraint the real API places on custom_id.
+CUSTOM_ID_PATTERN = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+
+def prompt_text(params):
+    """
+    Returns the text of the last user message in a Messages API request, whether given as a string or blocks.
+    """
+    content = params["messages"][-1]["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def template_responder(params):
+    """
+    Default fake model: answers every 'Section <name>: (max N characters)' line of a template prompt
+    with filler text of that length, and anything else with a short post.
+    """
+    sections = re.findall(r"^Section ([^:\n]+): \(max (\d+) characters\)", prompt_text(params), flags=re.MULTILINE)
+    if not sections:
+        return "Sample social media post generated by the fake batch endpoint."
+    lines = []
+    for section_name, max_chars in sections:
+        filler = " ".join(itertools.islice(itertools.cycle(["lorem", "ipsum", "dolor", "sit", "amet"]), int(max_chars)))
+        lines.append(f"Section {section_name}: {filler[:int(max_chars)].strip()}")
+    return "\n".join(lines)
+
+
+class FakeMessageBatches:
+    """
+    In-memory stand-in for client.messages.batches with create, retrieve and results.
+    Batches finish processing_seconds after creation; custom_ids in fail_custom_ids come back errored.
+    """
+
+    def __init__(self, responder=template_responder, processing_seconds=0.0, fail_custom_ids=()):
+        self.responder = responder
+        self.processing_seconds = processing_seconds
+        self.fail_custom_ids = set(fail_custom_ids)
+        self.batches = {}
+        self.calls = {"create": 0, "retrieve": 0, "results": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _batch_object(self, batch_id):
+        batch = self.batches[batch_id]
+        ended = time.monotonic() - batch["created_at"] >= self.processing_seconds
+        succeeded = sum(1 for r in batch["requests"] if r["custom_id"] not in self.fail_custom_ids)
+        return SimpleNamespace(
+            id=batch_id,
+            type="message_batch",
+            processing_status="ended" if ended else "in_progress",
+            request_counts=SimpleNamespace(
+                processing=0 if ended else len(batch["requests"]),
+                succeeded=succeeded if ended else 0,
+                errored=len(batch["requests"]) - succeeded if ended else 0,
+                canceled=0,
+                expired=0
+            )
+        )
+
+    def create(self, requests):
+        custom_ids = [request["custom_id"] for request in requests]
+        if len(set(custom_ids)) != len(custom_ids):
+            raise ValueError("custom_id values must be unique within a batch")
+        for custom_id in custom_ids:
+            if not CUSTOM_ID_PATTERN.match(custom_id):
+                raise ValueError(f"Invalid custom_id '{custom_id}'")
+        with self._lock:
+            self.calls["create"] += 1
+            batch_id = f"msgbatch_fake_{next(self._ids):06d}"
+            self.batches[batch_id] = {"requests": list(requests), "created_at": time.monotonic()}
+        return self._batch_object(batch_id)
+
+    def retrieve(self, batch_id):
+        with self._lock:
+            self.calls["retrieve"] += 1
+        return self._batch_object(batch_id)
+
+    def results(self, batch_id):
+        with self._lock:
+            self.calls["results"] += 1
+        if self._batch_object(batch_id).processing_status != "ended":
+            raise RuntimeError(f"Batch {batch_id} is still processing")
+        for request in self.batches[batch_id]["requests"]:
+            if request["custom_id"] in self.fail_custom_ids:
+                result = SimpleNamespace(type="errored", error=SimpleNamespace(type="api_error", message="Simulated failure"))
+            else:
+                text = self.responder(request["params"])
+                message = SimpleNamespace(
+                    content=[SimpleNamespace(type="text", text=text)],
+                    usage=SimpleNamespace(input_tokens=len(prompt_text(request["params"])) // 4, output_tokens=len(text) // 4)
+                )
+                result = SimpleNamespace(type="succeeded", message=message)
+            yield SimpleNamespace(custom_id=request["custom_id"], result=result)
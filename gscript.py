@@ -1,8 +1,11 @@
 import streamlit as st
-import pandas as pd
 import re
 import openai
 from streamlit_gsheets import GSheetsConnection
+from concurrent.futures import ThreadPoolExecutor
+from llm_response_cache import cached_chat_completion, get_response_cache
+from examples_source import get_examples_source
+from template_catalog import canonical_template_id, compile_template_catalog, render_structure
 
 st.markdown(
     """
@@ -63,6 +66,7 @@ st.markdown('<div class="app-container">', unsafe_allow_html=True)
 openai.api_key = st.secrets["openai_api_key"]
 
 client = openai
+response_cache = get_response_cache()
 
 def clean_text(text):
     text = re.sub(r'\*\*', '', text)
@@ -78,13 +82,27 @@ def clean_text(text):
     )
     return emoji_pattern.sub(r'', text)
 
+# Load the Templates CSV from disk; a newer copy on GitHub is fetched in the background.
+# version identifies the local copy, so a refreshed copy is read again.
+examples_source = get_examples_source()
+
 @st.cache_data
-def load_template_data():
-    url = "https://raw.githubusercontent.com/scooter7/videotemplateselectionform/main/Examples/examples.csv"
-    df = pd.read_csv(url)
+def load_template_data(version):
+    df = examples_source.read()
     return df
 
-template_data = load_template_data()
+# Compiled once per copy of the CSV into a read-only catalog keyed by canonical template id,
+# shared by every session instead of being normalized on each call
+@st.cache_resource
+def load_template_catalog(version):
+    return compile_template_catalog(
+        load_template_data(version),
+        prompt_compiler=render_structure,
+        key=canonical_template_id,
+        exclude_columns=("Description",)
+    )
+
+template_catalog = load_template_catalog(examples_source.version)
 
 @st.cache_data
 def load_google_sheet():
@@ -94,33 +112,25 @@ def load_google_sheet():
 
 sheet_data = load_google_sheet()
 
-def build_template_prompt(sheet_row, template_data):
+def build_template_prompt(sheet_row, template_catalog):
     job_number = sheet_row['Job Number']
     template_number = sheet_row['Template']
     description = sheet_row['Description']
     
-    template_data['Template'] = template_data['Template'].str.strip().str.lower()
-    template_filter = f"template {template_number}".lower()
-    template_row = template_data[template_data['Template'] == template_filter]
+    template = template_catalog.get(canonical_template_id(f"template {template_number}"))
     
     prompt = f"Create content using the following description as the main focus:\n\n'{description}'\n\nUse the following structure and tone for guidance, but do not copy verbatim:\n\n"
-    
-    for col in template_row.columns[2:]:
-        text_element = template_row[col].values[0]
-        if pd.notna(text_element):
-            prompt += f"{col}: {text_element}\n"
-    
+    if template is not None:
+        # The structure lines were rendered when the catalog was compiled
+        prompt += template.prompt
+
     return prompt, job_number
 
 def generate_content(prompt, job_number):
-    completion = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    content = completion.choices[0].message.content.strip()
+    content = cached_chat_completion(client, [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]).strip()
     content_clean = clean_text(content)
     return f"Job Number {job_number}: {content_clean}"
 
@@ -130,24 +140,23 @@ def generate_social_content(main_content, selected_channels):
         "linkedin": f"Generate a LinkedIn post based on the following content:\n{main_content}\nUse a tone similar to the posts on https://www.linkedin.com/company/shive-hattery/.",
         "instagram": f"Generate an Instagram post based on the following content:\n{main_content}\nUse a tone similar to the posts on https://www.instagram.com/shivehattery/."
     }
-    generated_content = {}
-    for channel in selected_channels:
+    def generate_channel_post(channel):
         prompt = social_prompts[channel]
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        generated_content[channel] = clean_text(completion.choices[0].message.content.strip())
+        content = cached_chat_completion(client, [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ])
+        return clean_text(content.strip())
+
+    with ThreadPoolExecutor(max_workers=max(len(selected_channels), 1)) as executor:
+        generated_content = dict(zip(selected_channels, executor.map(generate_channel_post, selected_channels)))
     return generated_content
 
 def main():
     st.title("AI Script Generator from Google Sheets and Templates")
     st.markdown("---")
 
-    if sheet_data.empty or template_data.empty:
+    if sheet_data.empty or not template_catalog:
         st.error("No data available from Google Sheets or Templates CSV.")
         return
 
@@ -156,7 +165,7 @@ def main():
     if st.button("Generate Content from Google Sheets and Templates"):
         generated_contents = []
         for idx, row in sheet_data.iterrows():
-            prompt, job_number = build_template_prompt(row, template_data)
+            prompt, job_number = build_template_prompt(row, template_catalog)
             generated_content = generate_content(prompt, job_number)
             generated_contents.append(generated_content)
         
@@ -201,6 +210,9 @@ def main():
                 mime="text/plain"
             )
 
+    cache_stats = response_cache.stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries stored.")
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
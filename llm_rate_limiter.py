@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+# Defaults used until the API reports the real limits in its rate-limit headers.
+DEFAULT_REQUESTS_PER_MINUTE = 50
+DEFAULT_TOKENS_PER_MINUTE = 40000
+# Fraction of the reported limits we aim for, so concurrent runs stay just under quota.
+SAFETY_MARGIN = 0.9
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def estimate_tokens(text, max_tokens=0):
+    """
+    Estimates the input plus output tokens of a request, at roughly four characters per token.
+    The output side is reserved at max_tokens and corrected by record_usage once the response arrives.
+    """
+    return len(text) // 4 + 1 + max_tokens
+
+
+def _reset_deadline(value, now):
+    """
+    Converts an RFC 3339 reset timestamp from a rate-limit header into a time.monotonic() deadline.
+    """
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds()) + now
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at capacity-per-minute.
+    Reservations may drive the balance negative; the caller then waits until it is paid back.
+    """
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / 60.0)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """
+        Takes amount tokens from the bucket and returns how many seconds to wait before using them.
+        """
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens * 60.0 / self.capacity
+
+    def refund(self, amount, now):
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def set_capacity(self, capacity_per_minute, now):
+        self._refill(now)
+        self.capacity = float(capacity_per_minute)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def clamp(self, remaining, now):
+        self._refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class RateLimiter:
+    """
+    Limits LLM calls to a number of requests and of input+output tokens per minute.
+    Thread-safe, and usable from both synchronous code and coroutines.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+
+    def _reserve(self, estimated_tokens):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(estimated_tokens, now),
+                self.paused_until - now,
+            )
+        return max(wait, 0.0)
+
+    def acquire(self, estimated_tokens):
+        """
+        Blocks until a request of estimated_tokens fits within the limits.
+        """
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens):
+        """
+        Waits, without blocking the event loop, until a request of estimated_tokens fits within the limits.
+        """
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """
+        Returns over-reserved tokens to the bucket, or charges the difference when the estimate was low.
+        """
+        with self._lock:
+            now = time.monotonic()
+            difference = estimated_tokens - actual_tokens
+            if difference >= 0:
+                self.tokens.refund(difference, now)
+            else:
+                self.tokens.reserve(-difference, now)
+
+    def update_from_headers(self, headers):
+        """
+        Adapts the buckets to the anthropic-ratelimit-* and retry-after headers of a response.
+        """
+        if not headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for bucket, prefix in ((self.requests, "anthropic-ratelimit-requests"), (self.tokens, "anthropic-ratelimit-tokens")):
+                limit = headers.get(f"{prefix}-limit")
+                if limit:
+                    try:
+                        bucket.set_capacity(float(limit) * SAFETY_MARGIN, now)
+                    except ValueError:
+                        pass
+                try:
+                    remaining = float(headers.get(f"{prefix}-remaining"))
+                except (TypeError, ValueError):
+                    continue
+                bucket.clamp(remaining, now)
+                if remaining <= 0:
+                    reset_at = _reset_deadline(headers.get(f"{prefix}-reset"), now)
+                    if reset_at:
+                        self.paused_until = max(self.paused_until, reset_at)
+            retry_after = headers.get("retry-after")
+            if retry_after:
+                try:
+                    self.paused_until = max(self.paused_until, now + float(retry_after))
+                except ValueError:
+                    pass
+
+
+def get_rate_limiter(requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+    """
+    Returns the process-wide rate limiter, creating it with the given limits on first use.
+    Every app in the process shares it, so their calls are budgeted against the same quota.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _rate_limiter
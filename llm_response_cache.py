@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_responses.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class ResponseCache:
+    """
+    On-disk cache of model responses keyed by model, max_tokens and a hash of the prompt.
+    Entries expire after ttl_seconds, and the least recently used ones are evicted beyond max_entries.
+    Safe to share between threads; hit and miss counts are kept for the life of the process.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model, max_tokens, prompt):
+        """
+        Fingerprints a request. prompt may be a string or any JSON-serialisable message list.
+        """
+        payload = json.dumps([model, max_tokens, prompt], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached response text for key, or None on a miss or an expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """
+        Stores response text under key, evicting the least recently used entries beyond max_entries.
+        Empty responses are not cached.
+        """
+        if not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+def get_response_cache(path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Returns the process-wide cache for path, creating it on first use.
+    """
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResponseCache(path, ttl_seconds, max_entries)
+        return _caches[path]
+
+
+def cached_chat_completion(client, messages, model="gpt-4o", cache=None):
+    """
+    Returns the reply to an OpenAI chat completion request, answered from cache (the process-wide default
+    cache if None) when an identical request was made before, so it is only paid for once.
+    """
+    cache = cache or get_response_cache()
+    key = cache.key(model, None, messages)
+    content = cache.get(key)
+    if content is None:
+        completion = client.chat.completions.create(model=model, messages=messages)
+        content = completion.choices[0].message.content
+        cache.put(key, content)
+    return content
@@ -0,0 +1,140 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import anthropic
+
+# HTTP statuses worth retrying besides 5xx: request timeout, lock conflict and rate limiting.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+# 5xx statuses after which the request may still have been carried out.
+AMBIGUOUS_STATUS_CODES = {504}
+
+
+class RetryableResponseError(Exception):
+    """
+    Raised by a caller to retry a response that arrived but cannot be used, such as an empty completion.
+    """
+
+
+def deadline_after(seconds):
+    """
+    Returns a time.monotonic() deadline the given number of seconds from now, or None for no deadline.
+    """
+    if seconds is None:
+        return None
+    return time.monotonic() + seconds
+
+
+def retry_after_seconds(exc):
+    """
+    Reads the retry-after-ms or retry-after header of a failed API response.
+    Returns the number of seconds to wait, or None if the server did not say.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Retries transient API failures with exponential backoff and full jitter.
+    Honors Retry-After, and never sleeps past the caller's deadline.
+    With idempotent False, for requests that must not be sent twice, failures after which the request
+    may have gone through anyway (timeouts, dropped connections, 504) are raised instead of retried.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=60.0, idempotent=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idempotent = idempotent
+
+    def is_retryable(self, exc):
+        """
+        Returns True for rate limits, overloads, 5xx responses, timeouts and dropped connections.
+        """
+        if isinstance(exc, RetryableResponseError):
+            return True
+        if isinstance(exc, (anthropic.APIConnectionError, ConnectionError, TimeoutError)):
+            return self.idempotent
+        if isinstance(exc, anthropic.APIStatusError):
+            if exc.status_code in AMBIGUOUS_STATUS_CODES and not self.idempotent:
+                return False
+            return exc.status_code in RETRYABLE_STATUS_CODES or exc.status_code >= 500
+        return False
+
+    def backoff(self, attempt, exc):
+        """
+        Returns how long to wait after the given zero-based attempt failed with exc.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _next_delay(self, attempt, exc, deadline):
+        # Returns None when the failure should be raised instead of retried.
+        if attempt >= self.max_attempts - 1 or not self.is_retryable(exc):
+            return None
+        delay = self.backoff(attempt, exc)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def run(self, func, deadline=None, on_retry=None):
+        """
+        Calls func until it succeeds, retrying transient failures.
+        on_retry(attempt, exc, delay) is called before each wait. The last failure is re-raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    async def run_async(self, func, deadline=None, on_retry=None):
+        """
+        Awaits func() until it succeeds, retrying transient failures.
+        on_retry(attempt, exc, delay) is called before each wait. The last failure is re-raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -2,15 +2,110 @@ import streamlit as st
 import pandas as pd
 import re
 import anthropic
-from google.oauth2.service_account import Credentials
 import gspread
+from sheets_client import open_first_worksheet, open_spreadsheet
+from sheet_reads import IncrementalSheetLoader, dedupe_headers
 import time
-from collections import defaultdict
+import asyncio
+import weakref
+import contextvars
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import logging
+import json
+from llm_rate_limiter import estimate_tokens, get_rate_limiter
+from llm_retry import RetryPolicy, RetryableResponseError, deadline_after
+from section_stream_parser import SectionStreamParser, trim_to_limit
+from llm_response_cache import get_response_cache
+from sheet_writes import OutputSheet, job_row
+from write_journal import get_write_journal, start_journal_replayer
+from run_manifest import get_run_manifest
+from template_catalog import compile_template_catalog
+from examples_source import get_examples_source
 
 # Initialize the Anthropic API client.
 anthropic_api_key = st.secrets["anthropic"]["anthropic_api_key"]
-client = anthropic.Anthropic(api_key=anthropic_api_key)
+# Retries are handled by RETRY_POLICY, so the SDK's own retries are turned off.
+client = anthropic.Anthropic(api_key=anthropic_api_key, max_retries=0)
+
+MODEL = "claude-3-5-sonnet-20241022"
+MAIN_MAX_TOKENS = 2000
+SOCIAL_MAX_TOKENS = 500
+# Combined mode asks for the main sections and all three social posts in one response.
+COMBINED_MAX_TOKENS = MAIN_MAX_TOKENS + 3 * SOCIAL_MAX_TOKENS
+COMBINED_TOOL_NAME = "record_job_content"
+# examples.csv is read from disk; a newer copy on GitHub is fetched in the background.
+examples_source = get_examples_source()
+# Social sections are limited to this many characters instead of the length of their example text.
+SOCIAL_SECTION_MAX_CHARS = {"LinkedIn": 500, "Facebook": 500, "Instagram": 500}
+
+# Number of intake rows generated in parallel by default, and the upper bound offered in the UI.
+DEFAULT_ROW_CONCURRENCY = 4
+MAX_ROW_CONCURRENCY = 16
+# Upper bound on Anthropic requests in flight at once, across every row of a run.
+MAX_CONCURRENT_LLM_REQUESTS = 8
+# Retry policy for transient API failures, and the total time a row may spend generating.
+RETRY_POLICY = RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0)
+# Submitting a Message Batch is paid for and cannot be undone, so it is only retried when the API rejected it.
+BATCH_SUBMIT_RETRY_POLICY = RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0, idempotent=False)
+ROW_DEADLINE_SECONDS = 600
+# How often batch mode checks whether a submitted Message Batch has finished.
+BATCH_POLL_INTERVAL_SECONDS = 60
+
+# Social channels generated for every job, and the output columns their posts land in.
+SOCIAL_CHANNELS = ['LinkedIn', 'Facebook', 'Instagram']
+SOCIAL_MEDIA_SECTION_NAMES = {
+    'LinkedIn': 'LinkedIn-Post-Content-Reco',
+    'Facebook': 'Facebook-Post-Content-Reco',
+    'Instagram': 'Instagram-Post-Content-Reco'
+}
+
+# Sections update_google_sheet writes from the intake row itself, never from the model's output.
+METADATA_SECTIONS = ("SubmitteeName", "SelectedTemplate", "Timestamp")
+
+# Output columns for sections missing from the output sheet's header row.
+OUTPUT_COLUMN_FALLBACK = {
+    'Text01': 'I', 'Text01-1': 'J', 'Text01-2': 'K', 'Text01-3': 'L', 'Text01-4': 'M',
+    '01BG-Theme-Text': 'N',
+    'Text02': 'O', 'Text02-1': 'P', 'Text02-2': 'Q', 'Text02-3': 'R', 'Text02-4': 'S',
+    '02BG-Theme-Text': 'T',
+    'Text03': 'U', 'Text03-1': 'V', 'Text03-2': 'W', 'Text03-3': 'X', 'Text03-4': 'Y',
+    '03BG-Theme-Text': 'Z',
+    'Text04': 'AA', 'Text04-1': 'AB', 'Text04-2': 'AC', 'Text04-3': 'AD', 'Text04-4': 'AE',
+    '04BG-Theme-Text': 'AF',
+    'Text05': 'AG', 'Text05-1': 'AH', 'Text05-2': 'AI', 'Text05-3': 'AJ', 'Text05-4': 'AK',
+    '05BG-Theme-Text': 'AL',
+    'Text06': 'AM', 'Text06-1': 'AN', 'Text06-2': 'AO', 'Text06-3': 'AP', 'Text06-4': 'AQ',
+    '06BG-Theme-Text': 'AR',
+    'Text07': 'AS', 'Text07-1': 'AT', 'Text07-2': 'AU', 'Text07-3': 'AV', 'Text07-4': 'AW',
+    '07BG-Theme-Text': 'AX',
+    'Text08': 'AY', 'Text08-1': 'AZ', 'Text08-2': 'BA', 'Text08-3': 'BB', 'Text08-4': 'BC',
+    '08BG-Theme-Text': 'BD',
+    'Text09': 'BE', 'Text09-1': 'BF', 'Text09-2': 'BG', 'Text09-3': 'BH', 'Text09-4': 'BI',
+    '09BG-Theme-Text': 'BJ',
+    'Text10': 'BK', 'Text10-1': 'BL', 'Text10-2': 'BM', 'Text10-3': 'BN', 'Text10-4': 'BO',
+    '10BG-Theme-Text': 'BP',
+    'CTA-Text': 'BQ', 'CTA-Text-1': 'BR', 'CTA-Text-2': 'BS', 'Tagline-Text': 'BT',
+    'LinkedIn-Post-Content-Reco': 'BV',
+    'Facebook-Post-Content-Reco': 'BW',
+    'Instagram-Post-Content-Reco': 'BX'
+}
+
+# Requests/minute and tokens/minute budget shared by every LLM call in this process.
+rate_limiter = get_rate_limiter(**st.secrets.get("rate_limits", {}))
+
+# On-disk cache of model responses, so unchanged prompts are not paid for twice.
+response_cache = get_response_cache()
+
+# Output rows are journaled on disk before they are written, and a background replayer
+# finishes any writes a crashed session or a quota stall left behind.
+sheet_write_journal = get_write_journal()
+start_journal_replayer(open_spreadsheet)
+
+# Async clients and semaphores are bound to the event loop they were created on.
+_loop_resources = weakref.WeakKeyDictionary()
+# Response cache lookups and prompt cache tokens of the run in progress. Each run sets its own counters, which
+# the tasks it starts inherit, so runs in other sessions never add to them.
+run_usage = contextvars.ContextVar("run_usage", default=None)
 
 # Hide unwanted Streamlit elements and apply custom styles.
 st.markdown(
@@ -58,43 +153,40 @@ st.markdown(
 )
 
 @st.cache_data
-def load_examples():
-    url = "https://raw.githubusercontent.com/scooter7/videotemplateselectionform/main/Examples/examples.csv"
+def load_examples(version):
+    """
+    Reads examples.csv from local disk; version identifies the copy, so a refreshed copy is read again.
+    """
     try:
-        examples = pd.read_csv(url)
+        examples = examples_source.read()
         return examples
     except Exception as e:
         st.error(f"Error loading examples CSV: {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def load_template_catalog(version):
+    """
+    Compiles examples.csv once per process into a read-only mapping of template name to TemplateSpec,
+    so resolving a row's template is a dictionary lookup and its prompt prefix is already rendered.
+    Social sections get a fixed limit.
+    """
+    return compile_template_catalog(load_examples(version), SOCIAL_SECTION_MAX_CHARS, template_extra_sections, compile_template_prompt)
+
 @st.cache_data
 def load_google_sheet(sheet_id):
     """
     Loads data from a Google Sheet, automatically handling duplicate column names.
     """
-    credentials_info = st.secrets["google_credentials"]
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    gc = gspread.authorize(credentials)
     try:
         # Access the first sheet of the specified Google Sheet.
-        sheet = gc.open_by_key(sheet_id).sheet1
+        sheet = open_first_worksheet(sheet_id)
         data = sheet.get_all_values()
         if not data:
             st.warning(f"Google Sheet with ID '{sheet_id}' is empty.")
             return pd.DataFrame()
         # Process headers and handle duplicates.
-        headers = data[0]
-        header_counts = defaultdict(int)
-        new_headers = []
-        for h in headers:
-            count = header_counts[h]
-            new_h = f"{h}_{count}" if count > 0 else h
-            new_headers.append(new_h)
-            header_counts[h] += 1
+        new_headers = dedupe_headers(data[0])
         # Create DataFrame from rows.
         rows = data[1:]
         df = pd.DataFrame(rows, columns=new_headers)
@@ -106,6 +198,22 @@ def load_google_sheet(sheet_id):
         st.error(f"An error occurred while loading the Google Sheet: {e}")
         return pd.DataFrame()
 
+def load_intake_sheet(sheet_id):
+    """
+    Returns the intake sheet as a DataFrame kept for the session.
+    The first call reads the whole sheet; later calls fetch only the rows appended since the previous one.
+    """
+    try:
+        if 'intake_loader' not in st.session_state:
+            st.session_state['intake_loader'] = IncrementalSheetLoader(open_first_worksheet(sheet_id))
+        st.session_state['intake_loader'].load()
+    except gspread.SpreadsheetNotFound:
+        st.error(f"Spreadsheet with ID '{sheet_id}' not found.")
+    except Exception as e:
+        st.error(f"An error occurred while loading the Google Sheet: {e}")
+    loader = st.session_state.get('intake_loader')
+    return loader.frame if loader else pd.DataFrame()
+
 def clean_text(text):
     text = re.sub(r'\*\*', '', text)
     emoji_pattern = re.compile(
@@ -120,30 +228,15 @@ def clean_text(text):
     )
     return emoji_pattern.sub(r'', text)
 
-def extract_template_structure(selected_template, examples_data):
+def template_extra_sections(selected_template):
     """
-    Extracts the structure of the specified template from the examples_data DataFrame.
-    Returns a list of tuples: (section_name, text_content, max_characters).
+    Returns the sections every template gets in addition to its own, filled in from the intake row.
     """
-    example_row = examples_data[examples_data['Template'] == selected_template]
-    if example_row.empty:
-        return None
-    template_structure = []
-    for col in example_row.columns:
-        if col != 'Template' and pd.notna(example_row[col].values[0]):
-            text_element = example_row[col].values[0]
-            max_chars = len(str(text_element))
-            if col in ["LinkedIn", "Facebook", "Instagram"]:
-                template_structure.append((col, text_element, 500))  # Default max chars.
-            else:
-                template_structure.append((col, text_element, max_chars))
-    additional_sections = [
+    return (
         ("SubmitteeName", "", 50),
         ("SelectedTemplate", selected_template, len(selected_template)),
         ("Timestamp", "", 20)
-    ]
-    template_structure.extend(additional_sections)
-    return template_structure
+    )
 
 def ensure_all_sections_populated(generated_content, template_structure):
     """
@@ -161,133 +254,433 @@ def ensure_all_sections_populated(generated_content, template_structure):
                 generated_content[section_name] = ""
     return generated_content
 
-def build_template_prompt(topic_description, template_structure):
+def compile_template_prompt(template_structure):
     """
-    Builds a prompt for content generation based on a topic description and template structure.
+    Renders the part of the prompt that depends only on the template: the instructions and section list.
+    Runs once per template when the catalog is compiled, so every row using the template shares the same text.
     """
-    if not (topic_description and template_structure):
-        return None
-    prompt = (
-        "Using the following description, generate content for each main section as specified. "
+    prefix = (
+        "Using the description given after the section list, generate content for each main section as specified. "
         "Each main section should start with 'Section [Section Name]:' followed by the content. "
         "Ensure that the content for each section does not exceed the specified character limit.\n\n"
     )
-    prompt += f"Description:\n{topic_description}\n\n"
     for section_name, _, max_chars in template_structure:
         if section_name == "SubmitteeName":
-            prompt += f"Section {section_name}: (Provide the name of the submittee. No character limit.)\n"
+            prefix += f"Section {section_name}: (Provide the name of the submittee. No character limit.)\n"
         elif section_name == "SelectedTemplate":
-            prompt += f"Section {section_name}: (Provide the name of the selected template. No character limit.)\n"
+            prefix += f"Section {section_name}: (Provide the name of the selected template. No character limit.)\n"
         elif section_name == "Timestamp":
-            prompt += f"Section {section_name}: (Include the timestamp in the format mm/dd/yyyy 00:00:00. No character limit.)\n"
+            prefix += f"Section {section_name}: (Include the timestamp in the format mm/dd/yyyy 00:00:00. No character limit.)\n"
         else:
-            prompt += f"Section {section_name}: (max {max_chars} characters)\n"
-    return prompt
+            prefix += f"Section {section_name}: (max {max_chars} characters)\n"
+    return prefix
+
+def build_template_prompt(topic_description, template_structure):
+    """
+    Builds a prompt for content generation based on a topic description and template structure.
+    The template's precompiled instructions and section list come first, so rows sharing a template
+    share the same prefix; only the description block differs between them.
+    Returns a list of message content blocks.
+    """
+    if not (topic_description and template_structure):
+        return None
+    return [
+        {"type": "text", "text": template_structure.prompt},
+        {"type": "text", "text": f"\nDescription:\n{topic_description}\n"}
+    ]
+
+def prompt_text(prompt):
+    """
+    Returns the plain text of a prompt given either as a string or as a list of content blocks.
+    """
+    if isinstance(prompt, str):
+        return prompt
+    return "".join(block["text"] for block in prompt)
+
+def get_async_resources():
+    """
+    Returns the async Anthropic client and the global request semaphore for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _loop_resources:
+        _loop_resources[loop] = (
+            anthropic.AsyncAnthropic(api_key=anthropic_api_key, max_retries=0),
+            asyncio.Semaphore(MAX_CONCURRENT_LLM_REQUESTS)
+        )
+    return _loop_resources[loop]
+
+async def run_blocking(func, *args):
+    """
+    Runs a blocking call (such as a Google Sheets write) on a worker thread without stalling the event loop.
+    The worker shares this session's script context so st.* calls inside it still render.
+    """
+    ctx = get_script_run_ctx()
+    def call():
+        add_script_run_ctx(None, ctx)
+        return func(*args)
+    return await asyncio.to_thread(call)
+
+def message_params(prompt, max_tokens, tool=None):
+    """
+    Returns the Messages API parameters for a single-turn prompt, shared by direct and batch requests.
+    When a tool is given the model is required to answer by calling it.
+    """
+    params = {
+        "model": MODEL,
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+    if tool:
+        params["tools"] = [tool]
+        params["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    return params
+
+async def create_message(prompt, max_tokens, tool=None):
+    """
+    Sends one Messages API request through the shared rate limiter and the global request semaphore.
+    Returns the parsed response.
+    """
+    async_client, llm_semaphore = get_async_resources()
+    estimated_tokens = estimate_tokens(prompt_text(prompt), max_tokens)
+    await rate_limiter.acquire_async(estimated_tokens)
+    try:
+        async with llm_semaphore:
+            raw_response = await async_client.messages.with_raw_response.create(**message_params(prompt, max_tokens, tool))
+    except anthropic.APIStatusError as e:
+        rate_limiter.update_from_headers(e.response.headers)
+        raise
+    rate_limiter.update_from_headers(raw_response.headers)
+    response = await raw_response.parse()
+    rate_limiter.record_usage(estimated_tokens, response.usage.input_tokens + response.usage.output_tokens)
+    record_prompt_cache_usage(response.usage)
+    return response
+
+def start_run_usage():
+    """
+    Starts counting response cache hits and misses and prompt cache tokens for a new run, and returns the counters.
+    """
+    usage = {"hits": 0, "misses": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0, "input_tokens": 0}
+    run_usage.set(usage)
+    return usage
+
+def count_usage(field, amount=1):
+    usage = run_usage.get()
+    if usage is not None:
+        usage[field] += amount
+
+def record_prompt_cache_usage(usage):
+    for field in ("cache_read_input_tokens", "cache_creation_input_tokens", "input_tokens"):
+        count_usage(field, getattr(usage, field, None) or 0)
+
+def cached_response(key):
+    """
+    Looks key up in the response cache, counting the hit or miss for the current run.
+    """
+    content = response_cache.get(key)
+    count_usage("hits" if content is not None else "misses")
+    return content
+
+def message_text(response):
+    """
+    Joins the text blocks of a Messages API response.
+    """
+    if isinstance(response.content, list):
+        return ''.join([block.text for block in response.content if hasattr(block, 'text')])
+    return response.content
+
+def tool_input_text(response, tool):
+    """
+    Returns the arguments of the tool call in a Messages API response as a JSON string, or "" if there is none,
+    if the response was cut off at max_tokens, or if the arguments leave out any of the tool's required fields.
+    """
+    if getattr(response, 'stop_reason', None) == 'max_tokens':
+        return ""
+    required = tool["input_schema"].get("required", [])
+    for block in response.content:
+        if getattr(block, 'type', None) == 'tool_use':
+            if not isinstance(block.input, dict) or any(key not in block.input for key in required):
+                return ""
+            return json.dumps(block.input)
+    return ""
+
+def response_text(response, params):
+    """
+    Returns the text cached for a response to params: the tool arguments when params require a tool call,
+    otherwise the text blocks. An empty string means the response is unusable.
+    """
+    if params.get("tools"):
+        return tool_input_text(response, params["tools"][0])
+    return message_text(response)
+
+def cache_key(params):
+    request = {k: v for k, v in params.items() if k not in ("model", "max_tokens")}
+    return response_cache.key(params["model"], params["max_tokens"], request)
+
+async def create_message_text(prompt, max_tokens):
+    """
+    Returns the response text for a prompt, from the response cache when the same request was made before.
+    """
+    key = cache_key(message_params(prompt, max_tokens))
+    content = cached_response(key)
+    if content is None:
+        content = message_text(await create_message(prompt, max_tokens))
+        # An empty response is retried by the caller, so it is not cached.
+        if content:
+            response_cache.put(key, content)
+    return content
+
+def warn_retry(label):
+    """
+    Returns an on_retry callback that tells the user a transient failure is being retried.
+    """
+    def on_retry(attempt, e, delay):
+        st.warning(f"{label} failed (attempt {attempt + 1}): {e}. Retrying in {delay:.1f} seconds...")
+    return on_retry
 
-def generate_content_with_retry(prompt, section_character_limits, retries=3, delay=5):
+def parse_generated_sections(content, section_character_limits):
+    """
+    Splits a complete model response into its 'Section <name>:' blocks and applies the character limits.
+    Returns a dictionary of sections, with the required fields and every limited section present.
+    """
+    parser = SectionStreamParser(section_character_limits, clean=clean_text)
+    parser.feed(content)
+    parser.close()
+    return complete_sections(parser.sections, section_character_limits)
+
+def complete_sections(sections, section_character_limits):
+    """
+    Adds the required fields and an empty entry for every limited section the model left out.
+    """
+    required_fields = ["SubmitteeName", "SelectedTemplate", "Timestamp"]
+    for field in required_fields:
+        if field not in sections:
+            if field == "Timestamp":
+                sections[field] = time.strftime("%m/%d/%Y %H:%M:%S")
+            else:
+                sections[field] = ""
+    for section in section_character_limits:
+        if section not in sections:
+            sections[section] = ""
+    return sections
+
+async def generate_content_with_retry(prompt, section_character_limits, deadline=None):
     """
     Generates content via the AI model with retry logic and applies character limits.
+    Transient failures are retried under RETRY_POLICY until the row's deadline.
     Returns a dictionary of sections.
     """
-    for i in range(retries):
-        try:
-            response = client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            if isinstance(response.content, list):
-                content = ''.join([block.text for block in response.content if hasattr(block, 'text')])
-            else:
-                content = response.content
-            if not content:
-                continue
-            content_clean = clean_text(content)
-            sections = {}
-            current_section = None
-            for line in content_clean.split('\n'):
-                line = line.strip()
-                if line.startswith("Section "):
-                    section_header = line.split(":", 1)
-                    if len(section_header) == 2:
-                        section_name = section_header[0].replace("Section ", "").strip()
-                        section_content = section_header[1].strip()
-                    else:
-                        section_name = line.replace("Section ", "").strip()
-                        section_content = ""
-                    current_section = section_name
-                    sections[current_section] = section_content
-                elif current_section:
-                    sections[current_section] += ' ' + line.strip()
-            for section in sections:
-                limit = section_character_limits.get(section, None)
-                if limit and len(sections[section]) > limit:
-                    trimmed_content = sections[section][:limit].rsplit(' ', 1)[0] or sections[section][:limit]
-                    sections[section] = trimmed_content.strip()
-            required_fields = ["SubmitteeName", "SelectedTemplate", "Timestamp"]
-            for field in required_fields:
-                if field not in sections:
-                    if field == "Timestamp":
-                        sections[field] = time.strftime("%m/%d/%Y %H:%M:%S")
-                    else:
-                        sections[field] = ""
-            for section in section_character_limits:
-                if section not in sections:
-                    sections[section] = ""
-            return sections
-        except Exception as e:
-            if 'overloaded' in str(e).lower() and i < retries - 1:
-                time.sleep(delay)
-            else:
-                st.error(f"Error during content generation: {e}")
-                return None
+    async def attempt():
+        content = await create_message_text(prompt, MAIN_MAX_TOKENS)
+        if not content:
+            raise RetryableResponseError("The model returned an empty response.")
+        return content
+    try:
+        content = await RETRY_POLICY.run_async(attempt, deadline=deadline, on_retry=warn_retry("Content generation"))
+    except Exception as e:
+        st.error(f"Error during content generation: {e}")
+        return None
+    return parse_generated_sections(content, section_character_limits)
+
+async def stream_content_with_retry(prompt, section_character_limits, on_section, deadline=None, on_attempt=None):
+    """
+    Streams content from the AI model, calling on_section(name, text) as each section completes.
+    Sections are trimmed to their character limits as they are emitted. A retried stream starts over,
+    so on_section may see a section again; on_attempt(), if given, is called before every attempt so the
+    caller can drop what an earlier attempt emitted. Only the first attempt reads the response cache, and only a
+    response with sections is cached, so a retry always asks the model again.
+    Returns a dictionary of sections, or None on failure.
+    """
+    params = message_params(prompt, MAIN_MAX_TOKENS)
+    key = cache_key(params)
+    attempts = 0
+    async def attempt():
+        nonlocal attempts
+        attempts += 1
+        if on_attempt:
+            on_attempt()
+        parser = SectionStreamParser(section_character_limits, clean=clean_text)
+        cached = cached_response(key) if attempts == 1 else None
+        if cached is not None:
+            for name, section_text in parser.feed(cached):
+                on_section(name, section_text)
+        else:
+            async_client, llm_semaphore = get_async_resources()
+            estimated_tokens = estimate_tokens(prompt_text(prompt), MAIN_MAX_TOKENS)
+            await rate_limiter.acquire_async(estimated_tokens)
+            chunks = []
+            try:
+                async with llm_semaphore:
+                    async with async_client.messages.stream(**params) as stream:
+                        rate_limiter.update_from_headers(stream.response.headers)
+                        async for text in stream.text_stream:
+                            chunks.append(text)
+                            for name, section_text in parser.feed(text):
+                                on_section(name, section_text)
+                        final_message = await stream.get_final_message()
+            except anthropic.APIStatusError as e:
+                rate_limiter.update_from_headers(e.response.headers)
+                raise
+            rate_limiter.record_usage(estimated_tokens, final_message.usage.input_tokens + final_message.usage.output_tokens)
+            record_prompt_cache_usage(final_message.usage)
+        for name, section_text in parser.close():
+            on_section(name, section_text)
+        if not parser.sections:
+            raise RetryableResponseError("The model returned no sections.")
+        if cached is None:
+            response_cache.put(key, ''.join(chunks))
+        return parser.sections
+    try:
+        sections = await RETRY_POLICY.run_async(attempt, deadline=deadline, on_retry=warn_retry("Content streaming"))
+    except Exception as e:
+        st.error(f"Error during content generation: {e}")
+        return None
+    return complete_sections(sections, section_character_limits)
+
+def build_social_prompt(main_content, channel):
+    return f"Generate a {channel.capitalize()} post based on this content:\n{main_content}\n"
+
+async def generate_social_post_with_retry(main_content, channel, deadline=None):
+    """
+    Generates a single social media post for one channel with retry logic.
+    Returns the post text, or an empty string if every attempt failed.
+    """
+    prompt = build_social_prompt(main_content, channel)
+    try:
+        content = await RETRY_POLICY.run_async(
+            lambda: create_message_text(prompt, SOCIAL_MAX_TOKENS),
+            deadline=deadline,
+            on_retry=warn_retry(f"{channel} post generation")
+        )
+    except Exception as e:
+        st.error(f"Error generating content for {channel}: {e}")
+        return ""
+    return content.strip() if content else ""
 
-def generate_social_content_with_retry(main_content, selected_channels, retries=3, delay=5):
+async def generate_social_content_with_retry(main_content, selected_channels, deadline=None):
     """
     Generates social media content for the specified channels with retry logic.
+    Channels are requested concurrently, so the wall time is that of the slowest channel.
     Returns a dictionary with the channel names as keys.
     """
-    generated_content = {}
-    for channel in selected_channels:
-        for attempt in range(retries):
-            try:
-                prompt = f"Generate a {channel.capitalize()} post based on this content:\n{main_content}\n"
-                response = client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=500,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                if isinstance(response.content, list):
-                    content = ''.join([block.text for block in response.content if hasattr(block, 'text')])
-                else:
-                    content = response.content
-                if content:
-                    generated_content[channel] = content.strip()
-                else:
-                    generated_content[channel] = ""
-                break
-            except Exception as e:
-                st.error(f"Error generating content for {channel} (attempt {attempt + 1}): {e}")
-                if 'overloaded' in str(e).lower() and attempt < retries - 1:
-                    time.sleep(delay)
-                else:
-                    generated_content[channel] = ""
-    return generated_content
+    posts = await asyncio.gather(*[
+        generate_social_post_with_retry(main_content, channel, deadline)
+        for channel in selected_channels
+    ])
+    return dict(zip(selected_channels, posts))
+
+def combined_tool_keys(template_structure):
+    """
+    Maps every template section and social post section to the property name used for it in the combined tool.
+    Tool property names must match ^[a-zA-Z0-9_.-]{1,64}$, and some CSV headers do not (e.g. '05BG-Theme-Text\r\n'),
+    so other characters become '_', names are cut to fit and clashes get a numeric suffix.
+    """
+    names = [section_name for section_name, _, _ in template_structure] + [SOCIAL_MEDIA_SECTION_NAMES[channel] for channel in SOCIAL_CHANNELS]
+    keys = {}
+    used = set()
+    for name in names:
+        base = re.sub(r"[^a-zA-Z0-9_.-]", "_", name.strip())[:60] or "section"
+        key = base
+        suffix = 1
+        while key in used:
+            suffix += 1
+            key = f"{base}_{suffix}"
+        used.add(key)
+        keys[name] = key
+    return keys
+
+def build_combined_tool(template_structure):
+    """
+    Builds the tool whose arguments carry every template section plus the three social posts.
+    """
+    keys = combined_tool_keys(template_structure)
+    properties = {}
+    for section_name, _, max_chars in template_structure:
+        properties[keys[section_name]] = {"type": "string", "description": f"Content for section {section_name.strip()} (max {max_chars} characters)."}
+    for channel in SOCIAL_CHANNELS:
+        properties[keys[SOCIAL_MEDIA_SECTION_NAMES[channel]]] = {"type": "string", "description": f"A {channel} post based on the content above."}
+    return {
+        "name": COMBINED_TOOL_NAME,
+        "description": "Records the generated content for every template section and the social media posts.",
+        "input_schema": {"type": "object", "properties": properties, "required": list(properties)}
+    }
+
+def build_combined_prompt(prompt):
+    """
+    Adds the social-post and tool instructions to the description block, and marks the template prefix for prompt caching.
+    The API only caches prefixes of 1024 tokens or more. The section list alone is shorter than that for every
+    bundled template, so only combined requests, whose prefix also holds the tool definition, carry the marker.
+    """
+    channels = ", ".join(SOCIAL_CHANNELS)
+    instructions = (
+        f"\nAlso write one post each for {channels} based on the content above. "
+        f"Return the section content and the posts by calling the {COMBINED_TOOL_NAME} tool, with one field per section.\n"
+    )
+    prefix, description = prompt
+    return [
+        dict(prefix, cache_control={"type": "ephemeral"}),
+        {"type": "text", "text": description["text"] + instructions}
+    ]
+
+def parse_combined_sections(content, job):
+    """
+    Splits the tool arguments of a combined response into template sections and social posts,
+    mapping the tool's property names back to section names.
+    Returns (sections, social_media_contents), or (None, None) if the arguments are unusable.
+    """
+    try:
+        fields = json.loads(content)
+    except ValueError:
+        return None, None
+    if not isinstance(fields, dict):
+        return None, None
+    section_character_limits = job["section_character_limits"]
+    names = {key: name for name, key in combined_tool_keys(job["template_structure"]).items()}
+    fields = {names.get(key, key): text for key, text in fields.items()}
+    social_media_contents = {}
+    for channel in SOCIAL_CHANNELS:
+        social_media_contents[channel] = str(fields.pop(SOCIAL_MEDIA_SECTION_NAMES[channel], "")).strip()
+    sections = {}
+    for section, text in fields.items():
+        sections[section] = trim_to_limit(clean_text(str(text)).strip(), section_character_limits.get(section, None))
+    return complete_sections(sections, section_character_limits), social_media_contents
+
+def combined_message_params(job):
+    return message_params(build_combined_prompt(job["prompt"]), COMBINED_MAX_TOKENS, build_combined_tool(job["template_structure"]))
 
-def divide_content_verbatim(main_content, subsections, section_character_limits):
+async def generate_combined_content_with_retry(job, deadline=None):
+    """
+    Generates every template section and the three social posts for a job in a single request.
+    Returns (sections, social_media_contents), or (None, None) on failure.
+    """
+    prompt = build_combined_prompt(job["prompt"])
+    tool = build_combined_tool(job["template_structure"])
+    key = cache_key(combined_message_params(job))
+    async def attempt():
+        content = cached_response(key)
+        if content is None:
+            content = tool_input_text(await create_message(prompt, COMBINED_MAX_TOKENS, tool), tool)
+            if not content:
+                raise RetryableResponseError("The model's tool call was missing, cut off or left out some of the requested fields.")
+            response_cache.put(key, content)
+        return content
+    try:
+        content = await RETRY_POLICY.run_async(attempt, deadline=deadline, on_retry=warn_retry("Combined generation"))
+    except Exception as e:
+        st.error(f"Error during content generation: {e}")
+        return None, None
+    return parse_combined_sections(content, job)
+
+def divide_content_verbatim(main_content, subsections, subsection_limits):
     """
     Divides the main content into subsections based on character limits.
+    subsection_limits holds each subsection's limit, in the same order as subsections.
     Returns a dictionary mapping subsection names to content.
     """
     words = main_content.split()
     total_words = len(words)
     subsections_content = {}
     start_idx = 0
-    for subsection in subsections:
-        limit = section_character_limits.get(subsection, None)
-        if limit is None:
-            subsections_content[subsection] = ""
-            continue
+    for subsection, limit in zip(subsections, subsection_limits):
         current_content = ''
         while start_idx < total_words:
             word = words[start_idx]
@@ -321,83 +714,413 @@ def get_column_name(df, name):
         logging.warning(f"Column '{name}' not found in DataFrame.")
     return cols[0] if cols else None
 
-def update_google_sheet(sheet_id, job_id, generated_content, source_row, submittee_name, selected_template):
+def update_google_sheet(output_sheet, job_id, generated_content, submittee_name, selected_template):
     """
-    Updates the specified Google Sheet with the generated content.
+    Queues the generated content for a job on the output sheet's write buffer.
     Also updates Job ID, Submittee Name, Selected Template, and Timestamp.
+    The whole row is one entry with the "complete" status as its last cell; its outcome is reported when the buffer sends it.
+    The row is found by Job ID in Column B when the entry is written, and appended if the Job ID is not there yet.
     """
-    credentials_info = st.secrets["google_credentials"]
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    gc = gspread.authorize(credentials)
     try:
-        sheet = gc.open_by_key(sheet_id).sheet1
-        # Locate Job ID in Column B.
-        cell = sheet.find(job_id, in_column=2)
-        if not cell:
-            target_row = source_row + 1
-            sheet.update_cell(target_row, 2, job_id)
-        else:
-            target_row = cell.row
-        # Update Submittee Name, Selected Template, and Timestamp.
-        sheet.update_cell(target_row, 4, submittee_name)
-        sheet.update_cell(target_row, 1, selected_template)
+        # Job ID in Column B, then Submittee Name, Selected Template, and Timestamp.
         timestamp = time.strftime("%m/%d/%Y %H:%M:%S")
-        sheet.update_cell(target_row, 3, timestamp)
-        # Mapping of content sections to columns.
-        column_mapping = {
-            'Text01': 'I', 'Text01-1': 'J', 'Text01-2': 'K', 'Text01-3': 'L', 'Text01-4': 'M',
-            '01BG-Theme-Text': 'N',
-            'Text02': 'O', 'Text02-1': 'P', 'Text02-2': 'Q', 'Text02-3': 'R', 'Text02-4': 'S',
-            '02BG-Theme-Text': 'T',
-            'Text03': 'U', 'Text03-1': 'V', 'Text03-2': 'W', 'Text03-3': 'X', 'Text03-4': 'Y',
-            '03BG-Theme-Text': 'Z',
-            'Text04': 'AA', 'Text04-1': 'AB', 'Text04-2': 'AC', 'Text04-3': 'AD', 'Text04-4': 'AE',
-            '04BG-Theme-Text': 'AF',
-            'Text05': 'AG', 'Text05-1': 'AH', 'Text05-2': 'AI', 'Text05-3': 'AJ', 'Text05-4': 'AK',
-            '05BG-Theme-Text': 'AL',
-            'Text06': 'AM', 'Text06-1': 'AN', 'Text06-2': 'AO', 'Text06-3': 'AP', 'Text06-4': 'AQ',
-            '06BG-Theme-Text': 'AR',
-            'Text07': 'AS', 'Text07-1': 'AT', 'Text07-2': 'AU', 'Text07-3': 'AV', 'Text07-4': 'AW',
-            '07BG-Theme-Text': 'AX',
-            'Text08': 'AY', 'Text08-1': 'AZ', 'Text08-2': 'BA', 'Text08-3': 'BB', 'Text08-4': 'BC',
-            '08BG-Theme-Text': 'BD',
-            'Text09': 'BE', 'Text09-1': 'BF', 'Text09-2': 'BG', 'Text09-3': 'BH', 'Text09-4': 'BI',
-            '09BG-Theme-Text': 'BJ',
-            'Text10': 'BK', 'Text10-1': 'BL', 'Text10-2': 'BM', 'Text10-3': 'BN', 'Text10-4': 'BO',
-            '10BG-Theme-Text': 'BP',
-            'CTA-Text': 'BQ', 'CTA-Text-1': 'BR', 'CTA-Text-2': 'BS', 'Tagline-Text': 'BT',
-            'LinkedIn-Post-Content-Reco': 'BV',
-            'Facebook-Post-Content-Reco': 'BW',
-            'Instagram-Post-Content-Reco': 'BX'
-        }
+        cells = [(2, job_id), (4, submittee_name), (1, selected_template), (3, timestamp)]
         for section, content in generated_content.items():
-            if section in column_mapping:
-                col = column_mapping[section]
-                col_index = gspread.utils.a1_to_rowcol(col + str(1))[1]
-                sheet.update_cell(target_row, col_index, content)
+            if section in METADATA_SECTIONS:
+                continue
+            col = output_sheet.columns.column(section)
+            if col:
+                cells.append((col, content))
             else:
-                st.warning(f"Section {section} not found in the hard-coded column mapping.")
-        # Mark the row as complete in Column CC (column index 81).
-        sheet.update_cell(target_row, 81, "complete")
-        st.success(f"Updated Google Sheet for Job ID {job_id} in row {target_row}")
+                st.warning(f"Section {section} not found in the output sheet headers.")
+        # Mark the row as complete in Column CC (column index 81). A batch update is applied as a whole,
+        # so the status cannot land without the content before it.
+        cells.append((81, "complete"))
+        output_sheet.buffer.add(job_id, job_row(job_id, cells))
     except Exception as e:
         st.error(f"Error updating Google Sheet: {e}")
 
+def prepare_row(idx, row, columns, template_catalog):
+    """
+    Validates an intake row and resolves its template structure, character limits and prompt.
+    Returns (job, result); job is None when the row is skipped, with the reason recorded in result.
+    """
+    job_id_col, selected_template_col, topic_description_col, submittee_name_col = columns
+    job_id_str = str(row[job_id_col]).strip()
+    result = {"idx": idx, "job_id": job_id_str, "status": "skipped", "messages": [], "content": None}
+    selected_template = row[selected_template_col]
+    topic_description = row[topic_description_col]
+    submittee_name = row[submittee_name_col]
+    result["messages"].append(("write", f"Processing row {idx + 1}: Job ID = {job_id_str}, Selected Template = {selected_template}, Topic Description = {topic_description}"))
+    if not (job_id_str and selected_template and topic_description and submittee_name):
+        result["messages"].append(("warning", f"Row {idx + 1} is missing required data. Skipping."))
+        return None, result
+    template_structure = template_catalog.get(selected_template)
+    if template_structure is None:
+        result["messages"].append(("warning", f"Template {selected_template} not found in examples data. Skipping row {idx + 1}."))
+        return None, result
+    section_character_limits = template_structure.limits
+    prompt = build_template_prompt(topic_description, template_structure)
+    if not prompt:
+        result["messages"].append(("warning", f"Failed to build prompt for row {idx + 1}. Skipping this row."))
+        return None, result
+    result["messages"].append(("write", f"Generated prompt for row {idx + 1}:\n{prompt_text(prompt)}"))
+    job = {
+        "idx": idx,
+        "job_id": job_id_str,
+        "selected_template": selected_template,
+        "submittee_name": submittee_name,
+        "template_structure": template_structure,
+        "section_character_limits": section_character_limits,
+        "prompt": prompt
+    }
+    return job, result
+
+def divide_section(main_section, main_content, job):
+    """
+    Divides one main section's text among its subsections.
+    Returns a dictionary mapping subsection names to content, empty if the section has no subsections.
+    """
+    group = job["template_structure"].subsection_groups.get(main_section)
+    if group is None:
+        return {}
+    subsections, subsection_limits = group
+    return divide_content_verbatim(main_content, subsections, subsection_limits)
+
+def split_into_subsections(generated_content, job, divided=None):
+    """
+    Fills in missing sections and divides each main section's text among its subsections.
+    divided holds splits already made while streaming, keyed by main section; those are not redone.
+    """
+    divided = divided or {}
+    generated_content = ensure_all_sections_populated(generated_content, job["template_structure"])
+    for main_section, (subsections, subsection_limits) in job["template_structure"].subsection_groups.items():
+        if main_section in divided:
+            divided_contents = divided[main_section]
+        else:
+            divided_contents = divide_content_verbatim(generated_content[main_section], subsections, subsection_limits)
+        generated_content.update(divided_contents)
+    return generated_content
+
+def combine_for_social(generated_content):
+    return "\n".join([f"{section}: {content}" for section, content in generated_content.items()])
+
+def apply_social_posts(generated_content, social_media_contents):
+    for channel in SOCIAL_CHANNELS:
+        section_name = SOCIAL_MEDIA_SECTION_NAMES[channel]
+        generated_content[section_name] = social_media_contents.get(channel, "")
+    return generated_content
+
+def write_job(output_sheet, job, generated_content):
+    update_google_sheet(
+        output_sheet,
+        job["job_id"],
+        generated_content,
+        job["submittee_name"],
+        job["selected_template"]
+    )
+
+def completed_job_ids(output_sheet_data, job_id_col, status_col):
+    """
+    Returns the set of Job IDs marked "complete" in the output sheet's status column.
+    """
+    if output_sheet_data.empty or not (job_id_col and status_col):
+        return set()
+    statuses = output_sheet_data[status_col].astype(str).str.strip().str.lower()
+    return set(output_sheet_data.loc[statuses == "complete", job_id_col].astype(str).str.strip())
+
+def report_sheet_writes(outcomes, run=None):
+    for job_id, error in outcomes:
+        if error is None:
+            st.success(f"Updated Google Sheet for Job ID {job_id}")
+            if run:
+                run.record(job_id, "written")
+        else:
+            st.error(f"Error updating Google Sheet for Job ID {job_id}: {error}")
+
+def checkpoint_row(run, job, result):
+    """
+    Looks up where a row got to in an earlier attempt of this run.
+    Returns (stage, content, social_media_contents); without a run every row starts pending.
+    """
+    if run is None:
+        return "pending", None, None
+    stage, content, social_media_contents = run.checkpoint(job["job_id"])
+    if stage != "pending":
+        result["messages"].append(("write", f"Resuming row {job['idx'] + 1}, Job ID = {job['job_id']} after stage '{stage}'"))
+    return stage, content, social_media_contents
+
+def record_stage(run, job, stage, content=None, social_media_contents=None):
+    if run:
+        run.record(job["job_id"], stage, content, social_media_contents)
+
+async def process_row(idx, row, columns, template_catalog, output_sheet, on_section=None, combined=False, run=None):
+    """
+    Generates, splits and writes the content for a single intake row.
+    Runs alongside other rows, so UI messages are collected and returned instead of rendered.
+    When on_section is given the response is streamed, and on_section(name, text, subsections)
+    is called as each main section completes, with that section's subsection split already made.
+    With combined, the sections and social posts come back together from one request.
+    With a run, each stage is checkpointed there, and a row resumed from it skips the stages it already finished.
+    Returns a dictionary with the row index, Job ID, status, messages and generated content.
+    """
+    job, result = prepare_row(idx, row, columns, template_catalog)
+    if job is None:
+        record_stage(run, {"job_id": result["job_id"]}, "skipped")
+        return result
+    stage, generated_content, social_media_contents = checkpoint_row(run, job, result)
+    if stage == "written":
+        return result
+    deadline = deadline_after(ROW_DEADLINE_SECONDS)
+    divided = {}
+    if stage == "pending":
+        if combined:
+            generated_content, social_media_contents = await generate_combined_content_with_retry(job, deadline)
+        elif on_section:
+            def handle_section(name, text):
+                divided[name] = divide_section(name, text, job)
+                on_section(name, text, divided[name])
+            # Splits from an attempt that was retried are dropped, so they never outlive the text they came from.
+            generated_content = await stream_content_with_retry(job["prompt"], job["section_character_limits"], handle_section, deadline, divided.clear)
+        else:
+            generated_content = await generate_content_with_retry(job["prompt"], job["section_character_limits"], deadline)
+        if not generated_content:
+            result["status"] = "failed"
+            result["messages"].append(("error", f"No content generated for row {idx + 1}, Job ID = {job['job_id']}"))
+            return result
+        result["messages"].append(("write", f"Content generated successfully for row {idx + 1}, Job ID = {job['job_id']}"))
+        record_stage(run, job, "generated", generated_content, social_media_contents)
+        stage = "generated"
+    if stage == "generated":
+        generated_content = split_into_subsections(generated_content, job, divided)
+        record_stage(run, job, "split", generated_content, social_media_contents)
+        stage = "split"
+    if stage == "split":
+        if social_media_contents is None:
+            social_media_contents = await generate_social_content_with_retry(combine_for_social(generated_content), SOCIAL_CHANNELS, deadline)
+        generated_content = apply_social_posts(generated_content, social_media_contents)
+        record_stage(run, job, "social_done", generated_content)
+    await run_blocking(write_job, output_sheet, job, generated_content)
+    result["status"] = "generated"
+    result["content"] = generated_content
+    return result
+
+def run_message_batch(batches_api, batch_requests, status_placeholder, run=None, batch_name=None):
+    """
+    Submits batch_requests as one Message Batch and polls until it has ended.
+    Requests already in the response cache are answered from it and left out of the batch.
+    Each succeeded message becomes its response_text, which is cached unless it is unusable.
+    With a run, the batch id is kept in it under batch_name until the results are collected, so a resumed
+    run collects a batch submitted before the interruption instead of paying for it again.
+    Returns a dictionary mapping each custom_id to its response text, or None when that request failed.
+    """
+    texts = {}
+    uncached_requests = []
+    for request in batch_requests:
+        cached = cached_response(cache_key(request["params"]))
+        if cached is not None:
+            texts[request["custom_id"]] = cached
+        else:
+            uncached_requests.append(request)
+    if not uncached_requests:
+        return texts
+    params_by_id = {request["custom_id"]: request["params"] for request in uncached_requests}
+    saved_batch_id = run.batch_id(batch_name) if run else None
+    if saved_batch_id:
+        status_placeholder.info(f"Collecting batch {saved_batch_id}, submitted before the run was interrupted.")
+        batch = RETRY_POLICY.run(lambda: batches_api.retrieve(saved_batch_id))
+    else:
+        batch = BATCH_SUBMIT_RETRY_POLICY.run(lambda: batches_api.create(requests=uncached_requests))
+        if run:
+            run.record_batch(batch_name, batch.id)
+    while batch.processing_status != "ended":
+        counts = batch.request_counts
+        status_placeholder.info(
+            f"Batch {batch.id}: {counts.processing} processing, {counts.succeeded} succeeded, {counts.errored} errored. "
+            f"Checking again in {BATCH_POLL_INTERVAL_SECONDS} seconds..."
+        )
+        time.sleep(BATCH_POLL_INTERVAL_SECONDS)
+        batch = RETRY_POLICY.run(lambda: batches_api.retrieve(batch.id))
+    status_placeholder.info(f"Batch {batch.id} has ended.")
+    for entry in RETRY_POLICY.run(lambda: list(batches_api.results(batch.id))):
+        if entry.custom_id not in params_by_id:
+            # A collected batch may hold requests that were answered from the cache since.
+            continue
+        if entry.result.type == "succeeded":
+            params = params_by_id[entry.custom_id]
+            record_prompt_cache_usage(entry.result.message.usage)
+            # An unusable response counts as failed and is not cached, so the request is sent again next time.
+            texts[entry.custom_id] = response_text(entry.result.message, params) or None
+            if texts[entry.custom_id]:
+                response_cache.put(cache_key(params), texts[entry.custom_id])
+        else:
+            texts[entry.custom_id] = None
+    if run:
+        # Succeeded requests are in the response cache now, so a later resume only submits the ones that failed.
+        run.record_batch(batch_name, None)
+    return texts
+
+def process_rows_in_batch(pending_rows, columns, template_catalog, output_sheet, batches_api, combined=False, run=None):
+    """
+    Generates every pending row through the Message Batches API instead of one request at a time.
+    The main prompts go out as one batch; the social prompts depend on their output, so they follow as a second batch.
+    With combined, each row is a single request returning both, so one batch is enough.
+    With a run, stages are checkpointed as in process_row, and resumed rows only join the batches they still need.
+    Returns the per-row results in intake-sheet order.
+    """
+    status_placeholder = st.empty()
+    jobs = []
+    results = {}
+    checkpoints = {}
+    for idx, row in pending_rows:
+        job, result = prepare_row(idx, row, columns, template_catalog)
+        results[idx] = result
+        if job is None:
+            record_stage(run, {"job_id": result["job_id"]}, "skipped")
+            continue
+        checkpoints[idx] = checkpoint_row(run, job, result)
+        if checkpoints[idx][0] != "written":
+            jobs.append(job)
+    if not jobs:
+        return [results[idx] for idx, _ in pending_rows]
+    # Batch custom_ids only allow [a-zA-Z0-9_-], so requests are keyed by intake row rather than Job ID.
+    new_jobs = [job for job in jobs if checkpoints[job["idx"]][0] == "pending"]
+    if not new_jobs:
+        main_texts = {}
+    elif combined:
+        main_texts = run_message_batch(
+            batches_api,
+            [{"custom_id": f"row-{job['idx']}", "params": combined_message_params(job)} for job in new_jobs],
+            status_placeholder,
+            run=run,
+            batch_name="main"
+        )
+    else:
+        main_texts = run_message_batch(
+            batches_api,
+            [{"custom_id": f"row-{job['idx']}", "params": message_params(job["prompt"], MAIN_MAX_TOKENS)} for job in new_jobs],
+            status_placeholder,
+            run=run,
+            batch_name="main"
+        )
+    generated = {}
+    social_posts = {}
+    finished = {}
+    for job in jobs:
+        result = results[job["idx"]]
+        stage, generated_content, social_media_contents = checkpoints[job["idx"]]
+        if stage == "pending":
+            content = main_texts.get(f"row-{job['idx']}")
+            if not content:
+                result["status"] = "failed"
+                result["messages"].append(("error", f"No content generated for row {job['idx'] + 1}, Job ID = {job['job_id']}"))
+                continue
+            if combined:
+                generated_content, social_media_contents = parse_combined_sections(content, job)
+                if generated_content is None:
+                    result["status"] = "failed"
+                    result["messages"].append(("error", f"Unusable response for row {job['idx'] + 1}, Job ID = {job['job_id']}"))
+                    continue
+            else:
+                generated_content = parse_generated_sections(content, job["section_character_limits"])
+            result["messages"].append(("write", f"Content generated successfully for row {job['idx'] + 1}, Job ID = {job['job_id']}"))
+            record_stage(run, job, "generated", generated_content, social_media_contents)
+            stage = "generated"
+        if stage == "generated":
+            generated_content = split_into_subsections(generated_content, job)
+            record_stage(run, job, "split", generated_content, social_media_contents)
+            stage = "split"
+        if stage == "social_done":
+            finished[job["idx"]] = generated_content
+            continue
+        generated[job["idx"]] = generated_content
+        if social_media_contents is not None:
+            social_posts[job["idx"]] = social_media_contents
+    social_requests = [
+        {"custom_id": f"row-{idx}-{channel}", "params": message_params(build_social_prompt(combine_for_social(generated_content), channel), SOCIAL_MAX_TOKENS)}
+        for idx, generated_content in generated.items()
+        if idx not in social_posts
+        for channel in SOCIAL_CHANNELS
+    ]
+    social_texts = run_message_batch(batches_api, social_requests, status_placeholder, run=run, batch_name="social") if social_requests else {}
+    for job in jobs:
+        if job["idx"] in finished:
+            generated_content = finished[job["idx"]]
+        elif job["idx"] in generated:
+            social_media_contents = social_posts.get(job["idx"])
+            if social_media_contents is None:
+                social_media_contents = {}
+                for channel in SOCIAL_CHANNELS:
+                    post = social_texts.get(f"row-{job['idx']}-{channel}")
+                    if post is None:
+                        results[job["idx"]]["messages"].append(("error", f"Error generating content for {channel} in row {job['idx'] + 1}"))
+                    social_media_contents[channel] = post.strip() if post else ""
+            generated_content = apply_social_posts(generated[job["idx"]], social_media_contents)
+            record_stage(run, job, "social_done", generated_content)
+        else:
+            continue
+        write_job(output_sheet, job, generated_content)
+        results[job["idx"]]["status"] = "generated"
+        results[job["idx"]]["content"] = generated_content
+    return [results[idx] for idx, _ in pending_rows]
+
+def section_display(container):
+    """
+    Returns an on_section callback that shows each section, and its subsection split, in container as it completes.
+    """
+    placeholders = {}
+    def on_section(name, text, subsections):
+        if name not in placeholders:
+            placeholders[name] = container.empty()
+        lines = [f"Section {name}: {text}"] + [f"    {s}: {content}" for s, content in subsections.items()]
+        placeholders[name].text("\n".join(lines))
+    return on_section
+
+async def process_rows_concurrently(pending_rows, columns, template_catalog, output_sheet, max_concurrent_rows, stream_sections=False, combined=False, run=None):
+    """
+    Processes independent intake rows concurrently, with at most max_concurrent_rows in progress.
+    Each row's messages are rendered as soon as that row finishes. With stream_sections, each row's
+    sections are also shown in its own expander while they are being generated.
+    Returns the per-row results in intake-sheet order.
+    """
+    results = []
+    if not pending_rows:
+        return results
+    progress = st.progress(0.0, text=f"0 of {len(pending_rows)} rows finished")
+    row_semaphore = asyncio.Semaphore(max_concurrent_rows)
+    displays = {}
+    if stream_sections:
+        for idx, row in pending_rows:
+            displays[idx] = section_display(st.expander(f"Row {idx + 1}: Job ID {str(row[columns[0]]).strip()}", expanded=False))
+
+    async def run_row(idx, row):
+        async with row_semaphore:
+            try:
+                return await process_row(idx, row, columns, template_catalog, output_sheet, displays.get(idx), combined, run)
+            except Exception as e:
+                job_id_str = str(row[columns[0]]).strip()
+                return {"idx": idx, "job_id": job_id_str, "status": "failed", "content": None,
+                        "messages": [("error", f"Unexpected error while processing row {idx + 1}, Job ID = {job_id_str}: {e}")]}
+
+    tasks = [run_row(idx, row) for idx, row in pending_rows]
+    for finished, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+        result = await next_result
+        for level, message in result["messages"]:
+            getattr(st, level)(message)
+        report_sheet_writes(output_sheet.buffer.drain(), run)
+        progress.progress(finished / len(pending_rows), text=f"{finished} of {len(pending_rows)} rows finished")
+        results.append(result)
+    results.sort(key=lambda r: r["idx"])
+    return results
+
 def main():
     st.title("AI Script Generator from Google Sheets and Templates")
     st.markdown("---")
-    # Load input data and examples.
-    if 'sheet_data' not in st.session_state:
-        st.session_state['sheet_data'] = load_google_sheet('1hUX9HPZjbnyrWMc92IytOt4ofYitHRMLSjQyiBpnMK8')
-    if 'examples_data' not in st.session_state:
-        st.session_state['examples_data'] = load_examples()
+    # Load input data and examples. After the first run only newly appended intake rows are fetched.
+    st.session_state['sheet_data'] = load_intake_sheet('1hUX9HPZjbnyrWMc92IytOt4ofYitHRMLSjQyiBpnMK8')
+    template_catalog = load_template_catalog(examples_source.version)
     sheet_data = st.session_state['sheet_data']
-    examples_data = st.session_state['examples_data']
-    if sheet_data.empty or examples_data.empty:
+    if sheet_data.empty or not template_catalog:
         st.error("No data available from Google Sheets or Templates CSV.")
         return
     st.dataframe(sheet_data)
@@ -408,9 +1131,21 @@ def main():
     status_col = output_sheet_data.columns[80] if len(output_sheet_data.columns) > 80 else None
     if 'generated_contents' not in st.session_state:
         st.session_state['generated_contents'] = []
+    max_concurrent_rows = st.slider("Rows to process in parallel", min_value=1, max_value=MAX_ROW_CONCURRENCY, value=DEFAULT_ROW_CONCURRENCY)
+    batch_mode = st.checkbox("Batch mode (Message Batches API: lower cost, results can take up to 24 hours)")
+    combined = st.checkbox("Generate sections and social posts in one request per row")
+    stream_sections = st.checkbox("Show sections as they are generated", value=True, disabled=batch_mode or combined)
+    # An interrupted run can be picked up where it stopped, row by row, with its original options.
+    # Rows the output sheet already has as complete are closed first, so they are never offered for a resume.
+    completed = completed_job_ids(output_sheet_data, output_job_id_col, status_col)
+    manifest = get_run_manifest()
+    manifest.supersede(completed)
+    resume_run = manifest.latest_unfinished_run()
+    resume = False
+    if resume_run is not None:
+        resume = st.button(f"Resume interrupted run ({len(resume_run.unfinished_job_ids())} rows left)")
     # When the button is pressed:
-    if st.button("Generate Content"):
-        generated_contents = []
+    if st.button("Generate Content") or resume:
         job_id_col = get_column_name(sheet_data, 'Job ID')
         selected_template_col = get_column_name(sheet_data, 'Selected-Template')
         topic_description_col = get_column_name(sheet_data, 'Topic-Description')
@@ -418,75 +1153,55 @@ def main():
         if not all([job_id_col, selected_template_col, topic_description_col, submittee_name_col]):
             st.error("Required columns ('Job ID', 'Selected-Template', 'Topic-Description', 'Submittee-Name') not found.")
             return
-        # Iterate over each row.
-        for idx, row in sheet_data.iterrows():
-            job_id_str = str(row[job_id_col]).strip()
-            skip_this = False
-            # Check if this row is already marked complete in the output sheet.
-            if output_sheet_data is not None and output_job_id_col and status_col:
-                output_sheet_data[output_job_id_col] = output_sheet_data[output_job_id_col].astype(str).str.strip()
-                existing_rows = output_sheet_data[output_sheet_data[output_job_id_col] == job_id_str]
-                if not existing_rows.empty:
-                    for _, out_row in existing_rows.iterrows():
-                        status_val = str(out_row[status_col]).strip().lower()
-                        if status_val == "complete":
-                            st.info(f"Row {idx + 1} with Job ID {job_id_str} is already complete. Skipping generation.")
-                            skip_this = True
-                            break
-            if skip_this:
-                continue
-            selected_template = row[selected_template_col]
-            topic_description = row[topic_description_col]
-            submittee_name = row[submittee_name_col]
-            st.write(f"Processing row {idx + 1}: Job ID = {job_id_str}, Selected Template = {selected_template}, Topic Description = {topic_description}")
-            if not (job_id_str and selected_template and topic_description and submittee_name):
-                st.warning(f"Row {idx + 1} is missing required data. Skipping.")
-                continue
-            template_structure = extract_template_structure(selected_template, examples_data)
-            if template_structure is None:
-                st.warning(f"Template {selected_template} not found in examples data. Skipping row {idx + 1}.")
-                continue
-            section_character_limits = {name: max_chars for name, _, max_chars in template_structure}
-            prompt = build_template_prompt(topic_description, template_structure)
-            if not prompt:
-                st.warning(f"Failed to build prompt for row {idx + 1}. Skipping this row.")
-                continue
-            st.write(f"Generated prompt for row {idx + 1}:\n{prompt}")
-            generated_content = generate_content_with_retry(prompt, section_character_limits)
-            if generated_content:
-                st.write(f"Content generated successfully for row {idx + 1}, Job ID = {job_id_str}")
-                generated_content = ensure_all_sections_populated(generated_content, template_structure)
-                full_content = generated_content.copy()
-                for main_section in full_content:
-                    subsections = [s for s, _, _ in template_structure if s.startswith(f"{main_section}-")]
-                    if subsections:
-                        main_content = generated_content[main_section]
-                        subsection_character_limits = {s: section_character_limits[s] for s in subsections}
-                        divided_contents = divide_content_verbatim(main_content, subsections, subsection_character_limits)
-                        generated_content.update(divided_contents)
-                social_channels = ['LinkedIn', 'Facebook', 'Instagram']
-                combined_content = "\n".join([f"{section}: {content}" for section, content in generated_content.items()])
-                social_media_contents = generate_social_content_with_retry(combined_content, social_channels)
-                social_media_section_names = {
-                    'LinkedIn': 'LinkedIn-Post-Content-Reco',
-                    'Facebook': 'Facebook-Post-Content-Reco',
-                    'Instagram': 'Instagram-Post-Content-Reco'
-                }
-                for channel in social_channels:
-                    section_name = social_media_section_names[channel]
-                    generated_content[section_name] = social_media_contents.get(channel, "")
-                generated_contents.append((job_id_str, generated_content))
-                update_google_sheet(
-                    output_sheet_id,
-                    job_id_str,
-                    generated_content,
-                    idx + 1,
-                    submittee_name,
-                    selected_template
+        columns = (job_id_col, selected_template_col, topic_description_col, submittee_name_col)
+        # Collect the rows that still need work: intake rows whose Job ID is not marked complete in the output sheet.
+        intake_job_ids = sheet_data[job_id_col].astype(str).str.strip()
+        is_complete = intake_job_ids.isin(completed)
+        for idx in sheet_data.index[is_complete]:
+            st.info(f"Row {idx + 1} with Job ID {intake_job_ids[idx]} is already complete. Skipping generation.")
+        if resume:
+            run = resume_run
+            combined = run.options.get("combined", False)
+            batch_mode = run.options.get("batch", False)
+            pending_rows = list(sheet_data[intake_job_ids.isin(run.unfinished_job_ids()) & ~is_complete].iterrows())
+        else:
+            pending_rows = list(sheet_data[~is_complete].iterrows())
+            run = manifest.start_run([str(row[job_id_col]).strip() for _, row in pending_rows], {"combined": combined, "batch": batch_mode})
+        # The output sheet's header row and Job ID column are read once per run; finished rows
+        # are then written in groups rather than one request per row.
+        try:
+            output_sheet = OutputSheet(open_first_worksheet(output_sheet_id), OUTPUT_COLUMN_FALLBACK, sheet_write_journal)
+        except Exception as e:
+            st.error(f"Error opening the output Google Sheet: {e}")
+            return
+        usage = start_run_usage()
+        if batch_mode:
+            try:
+                results = process_rows_in_batch(pending_rows, columns, template_catalog, output_sheet, client.messages.batches, combined, run)
+            except Exception as e:
+                st.error(
+                    f"Batch generation stopped: {e}. If a batch was being submitted, check the Anthropic Console "
+                    "before trying again, as it may have been accepted."
                 )
-            else:
-                st.error(f"No content generated for row {idx + 1}, Job ID = {job_id_str}")
+                report_sheet_writes(output_sheet.buffer.close(), run)
+                return
+            for result in results:
+                for level, message in result["messages"]:
+                    getattr(st, level)(message)
+        else:
+            results = asyncio.run(process_rows_concurrently(pending_rows, columns, template_catalog, output_sheet, max_concurrent_rows, stream_sections and not combined, combined, run))
+        report_sheet_writes(output_sheet.buffer.close(), run)
+        journal_stats = sheet_write_journal.stats()
+        if journal_stats['pending']:
+            st.caption(f"Write journal: {journal_stats['pending']} rows waiting to be written to Google Sheets; they will be retried in the background.")
+        generated_contents = [(r["job_id"], r["content"]) for r in results if r["content"]]
         st.session_state['generated_contents'] = generated_contents
+        cache_stats = response_cache.stats()
+        st.caption(f"Response cache this run: {usage['hits']} hits, {usage['misses']} misses; {cache_stats['entries']} entries stored.")
+        st.caption(
+            f"Prompt cache this run: {usage['cache_read_input_tokens']} input tokens read from cache, "
+            f"{usage['cache_creation_input_tokens']} written to cache, {usage['input_tokens']} uncached."
+        )
         for job_id, content in generated_contents:
             st.subheader(f"Generated Content for Job ID: {job_id}")
             for section, text in content.items():
@@ -2,13 +2,32 @@ import streamlit as st
 import pandas as pd
 import re
 import anthropic
-from google.oauth2.service_account import Credentials
 import gspread
-import time
-from collections import defaultdict
+from sheets_client import open_first_worksheet, open_spreadsheet
+from sheet_reads import IncrementalSheetLoader
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from llm_rate_limiter import estimate_tokens, get_rate_limiter
+from llm_retry import RetryPolicy, deadline_after
+from sheet_writes import OutputSheet, job_row
+from write_journal import get_write_journal, start_journal_replayer
+from template_catalog import compile_template_catalog
+from examples_source import get_examples_source
 
 anthropic_api_key = st.secrets["anthropic"]["anthropic_api_key"]
-client = anthropic.Client(api_key=anthropic_api_key)
+# Retries are handled by RETRY_POLICY, so the SDK's own retries are turned off
+client = anthropic.Client(api_key=anthropic_api_key, max_retries=0)
+rate_limiter = get_rate_limiter(**st.secrets.get("rate_limits", {}))
+RETRY_POLICY = RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0)
+ROW_DEADLINE_SECONDS = 600
+
+# Output rows are journaled on disk before they are written, and a background replayer
+# finishes any writes a crashed session or a quota stall left behind
+sheet_write_journal = get_write_journal()
+start_journal_replayer(open_spreadsheet)
+
+# examples.csv is read from disk; a newer copy on GitHub is fetched in the background
+examples_source = get_examples_source()
 
 st.markdown(
     """
@@ -55,47 +74,37 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-def load_google_sheet(sheet_id):
-    credentials_info = st.secrets["google_credentials"]
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = Credentials.from_service_account_info(
-        credentials_info, scopes=scopes
-    )
-    gc = gspread.authorize(credentials)
+def load_intake_sheet(sheet_id):
+    """
+    Returns the intake sheet as a DataFrame kept for the session.
+    The first call reads the whole sheet; later calls fetch only the rows appended since the previous one.
+    """
     try:
-        sheet = gc.open_by_key(sheet_id).sheet1
-        data = sheet.get_all_values()
-        headers = data[0]
-        header_counts = defaultdict(int)
-        new_headers = []
-        for h in headers:
-            count = header_counts[h]
-            if count > 0:
-                new_h = f"{h}_{count}"
-            else:
-                new_h = h
-            new_headers.append(new_h)
-            header_counts[h] +=1
-        rows = data[1:]
-        df = pd.DataFrame(rows, columns=new_headers)
-        return df
+        if 'intake_loader' not in st.session_state:
+            st.session_state['intake_loader'] = IncrementalSheetLoader(open_first_worksheet(sheet_id))
+        st.session_state['intake_loader'].load()
     except gspread.SpreadsheetNotFound:
         st.error(f"Spreadsheet with ID '{sheet_id}' not found.")
-        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"An error occurred while loading the Google Sheet: {e}")
+    loader = st.session_state.get('intake_loader')
+    return loader.frame if loader else pd.DataFrame()
 
+# Read from disk; version identifies the local copy, so a refreshed copy is read again
 @st.cache_data
-def load_examples():
-    url = "https://raw.githubusercontent.com/scooter7/videotemplateselectionform/main/Examples/examples.csv"
+def load_examples(version):
     try:
-        examples = pd.read_csv(url)
+        examples = examples_source.read()
         return examples
     except Exception as e:
         st.error(f"Error loading examples CSV: {e}")
         return pd.DataFrame()
 
+# Compiled once per process, so each row's template is a dictionary lookup with its prompt text already rendered
+@st.cache_resource
+def load_template_catalog(version):
+    return compile_template_catalog(load_examples(version), prompt_compiler=compile_template_prompt)
+
 def clean_text(text):
     text = re.sub(r'\*\*', '', text)
     emoji_pattern = re.compile(
@@ -110,7 +119,7 @@ def clean_text(text):
     )
     return emoji_pattern.sub(r'', text)
 
-def extract_template_structure(selected_template, examples_data):
+def extract_template_structure(selected_template, template_catalog):
     if "template_SH_" in selected_template:
         try:
             template_number = int(selected_template.split('_')[-1])
@@ -120,102 +129,104 @@ def extract_template_structure(selected_template, examples_data):
     else:
         template_number_str = "01"
 
-    example_row = examples_data[examples_data['Template'] == f'template_SH_{template_number_str}']
-    if example_row.empty:
-        return None
+    return template_catalog.get(f'template_SH_{template_number_str}')
 
-    template_structure = []
-    for col in example_row.columns:
-        if col != 'Template':
-            text_element = example_row[col].values[0]
-            if pd.notna(text_element):
-                max_chars = len(str(text_element))
-                template_structure.append((col, text_element, max_chars))
-    return template_structure
+# The SDK's HUMAN_PROMPT/AI_PROMPT markers are added when a prompt is built, not here, so the page
+# still loads with SDK versions that no longer define them
+PROMPT_INSTRUCTIONS = "Using the following description, generate content for each main section as specified. Each main section should start with 'Section [Section Name]:' followed by the content. Do not generate content for subsections. Ensure that the content for each section does not exceed the specified character limit. Do not include any mention of character counts or limits in your output.\n\n"
+
+# Renders the text that follows the description once per template, when the catalog is compiled
+def compile_template_prompt(template_structure):
+    prompt_tail = ""
+    for section_name, _, max_chars in template_structure:
+        if '-' not in section_name:
+            prompt_tail += f"Section {section_name}: (max {max_chars} characters)\n"
+
+    prompt_tail += "\nPlease provide the content for each main section as specified, starting each with 'Section [Section Name]:'. Do not include subsections. Do not include any additional text or explanations.\n"
+
+    return prompt_tail
 
 def build_template_prompt(topic_description, template_structure):
     if not (topic_description and template_structure):
         return None
 
-    prompt = f"{anthropic.HUMAN_PROMPT}Using the following description, generate content for each main section as specified. Each main section should start with 'Section [Section Name]:' followed by the content. Do not generate content for subsections. Ensure that the content for each section does not exceed the specified character limit. Do not include any mention of character counts or limits in your output.\n\n"
-    prompt += f"Description:\n{topic_description}\n\n"
+    return f"{anthropic.HUMAN_PROMPT}{PROMPT_INSTRUCTIONS}Description:\n{topic_description}\n\n{template_structure.prompt}{anthropic.AI_PROMPT}"
 
-    for section_name, _, max_chars in template_structure:
-        if '-' not in section_name:
-            prompt += f"Section {section_name}: (max {max_chars} characters)\n"
+def create_completion(prompt, max_tokens_to_sample):
+    # Every completion goes through the shared rate limiter, which also learns from the response headers
+    estimated_tokens = estimate_tokens(prompt, max_tokens_to_sample)
+    rate_limiter.acquire(estimated_tokens)
+    try:
+        raw_response = client.completions.with_raw_response.create(
+            prompt=prompt,
+            model="claude-2",
+            max_tokens_to_sample=max_tokens_to_sample,
+            temperature=0.7,
+        )
+    except anthropic.APIStatusError as e:
+        rate_limiter.update_from_headers(e.response.headers)
+        raise
+    rate_limiter.update_from_headers(raw_response.headers)
+    response = raw_response.parse()
+    rate_limiter.record_usage(estimated_tokens, estimate_tokens(prompt + (response.completion or "")))
+    return response
+
+def generate_content_with_retry(prompt, section_character_limits, deadline=None):
+    def on_retry(attempt, e, delay):
+        st.warning(f"API call failed ({e}), retrying in {delay:.1f} seconds... (Attempt {attempt + 1} of {RETRY_POLICY.max_attempts})")
 
-    prompt += "\nPlease provide the content for each main section as specified, starting each with 'Section [Section Name]:'. Do not include subsections. Do not include any additional text or explanations.\n" + anthropic.AI_PROMPT
+    try:
+        response = RETRY_POLICY.run(lambda: create_completion(prompt, 2000), deadline=deadline, on_retry=on_retry)
+    except Exception as e:
+        st.error(f"Error generating content: {e}")
+        return None
 
-    return prompt
+    content = response.completion if response.completion else "No content generated."
 
-def generate_content_with_retry(prompt, section_character_limits, retries=3, delay=5):
-    for i in range(retries):
-        try:
-            response = client.completions.create(
-                prompt=prompt,
-                model="claude-2",
-                max_tokens_to_sample=2000,
-                temperature=0.7,
-            )
-
-            content = response.completion if response.completion else "No content generated."
-
-            content_clean = clean_text(content)
-
-            sections = {}
-            current_section = None
-            for line in content_clean.split('\n'):
-                line = line.strip()
-                if line.startswith("Section "):
-                    section_header = line.split(":", 1)
-                    if len(section_header) == 2:
-                        section_name = section_header[0].replace("Section ", "").strip()
-                        section_content = section_header[1].strip()
-                    else:
-                        section_name = line.replace("Section ", "").strip()
-                        section_content = ""
-                    current_section = section_name
-                    sections[current_section] = section_content
-                elif current_section:
-                    sections[current_section] += ' ' + line.strip()
-
-            # Trim content to character limits without cutting off mid-word
-            for section in sections:
-                limit = section_character_limits.get(section, None)
-                if limit:
-                    content = sections[section]
-                    if len(content) > limit:
-                        # Trim without cutting off mid-word
-                        trimmed_content = content[:limit].rsplit(' ', 1)[0]
-                        if not trimmed_content:
-                            # If trimming removes all content, keep the original up to limit
-                            trimmed_content = content[:limit]
-                        sections[section] = trimmed_content.strip()
-                else:
-                    sections[section] = sections[section].strip()
-
-            return sections
-
-        except anthropic.ApiException as e:
-            if 'overloaded' in str(e).lower() and i < retries - 1:
-                st.warning(f"API is overloaded, retrying in {delay} seconds... (Attempt {i + 1} of {retries})")
-                time.sleep(delay)
+    content_clean = clean_text(content)
+
+    sections = {}
+    current_section = None
+    for line in content_clean.split('\n'):
+        line = line.strip()
+        if line.startswith("Section "):
+            section_header = line.split(":", 1)
+            if len(section_header) == 2:
+                section_name = section_header[0].replace("Section ", "").strip()
+                section_content = section_header[1].strip()
             else:
-                st.error(f"Error generating content: {e}")
-                return None
+                section_name = line.replace("Section ", "").strip()
+                section_content = ""
+            current_section = section_name
+            sections[current_section] = section_content
+        elif current_section:
+            sections[current_section] += ' ' + line.strip()
+
+    # Trim content to character limits without cutting off mid-word
+    for section in sections:
+        limit = section_character_limits.get(section, None)
+        if limit:
+            content = sections[section]
+            if len(content) > limit:
+                # Trim without cutting off mid-word
+                trimmed_content = content[:limit].rsplit(' ', 1)[0]
+                if not trimmed_content:
+                    # If trimming removes all content, keep the original up to limit
+                    trimmed_content = content[:limit]
+                sections[section] = trimmed_content.strip()
+        else:
+            sections[section] = sections[section].strip()
+
+    return sections
 
-def divide_content_verbatim(main_content, subsections, section_character_limits):
+def divide_content_verbatim(main_content, subsections, subsection_limits):
     words = main_content.split()
     total_words = len(words)
     num_subsections = len(subsections)
     subsections_content = {}
     start_idx = 0
 
-    for subsection in subsections:
-        limit = section_character_limits.get(subsection, None)
-        if limit is None:
-            continue
-
+    for subsection, limit in zip(subsections, subsection_limits):
         current_content = ''
         while start_idx < total_words:
             word = words[start_idx]
@@ -241,49 +252,36 @@ def divide_content_verbatim(main_content, subsections, section_character_limits)
 
     return subsections_content
 
-def update_google_sheet(sheet_id, job_id, generated_content):
-    credentials_info = st.secrets["google_credentials"]
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = Credentials.from_service_account_info(
-        credentials_info, scopes=scopes
-    )
-    gc = gspread.authorize(credentials)
-
+def update_google_sheet(output_sheet, job_id, generated_content):
+    """
+    Queues the generated sections for the row of the output sheet holding job_id on its write buffer.
+    The outcome is reported when the buffer sends it.
+    """
     try:
-        sheet = gc.open_by_key(sheet_id).sheet1
-
-        cell = sheet.find(job_id, in_column=2)
-        if not cell:
+        row = output_sheet.rows.get(job_id)
+        if not row:
             st.warning(f"Job ID {job_id} not found in the sheet.")
             return
 
-        row = cell.row
-
-        headers = sheet.row_values(1)
-        header_to_col = {}
-        header_counts = defaultdict(int)
-        for idx, h in enumerate(headers):
-            count = header_counts[h]
-            if count > 0:
-                new_h = f"{h}_{count}"
-            else:
-                new_h = h
-            header_counts[h] +=1
-            header_to_col[new_h] = idx +1  # 1-based indexing
-
+        cells = []
         for section, content in generated_content.items():
-            if section in header_to_col:
-                col = header_to_col[section]
-                sheet.update_cell(row, col, content)
+            col = output_sheet.columns.column(section)
+            if col:
+                cells.append((col, content))
             else:
                 st.warning(f"Section {section} not found in sheet headers.")
-        st.success(f"Updated Google Sheet for Job ID {job_id}")
+        # The row is looked up again by Job ID when the buffer writes it
+        output_sheet.buffer.add(job_id, job_row(job_id, cells))
     except Exception as e:
         st.error(f"Error updating Google Sheet: {e}")
 
+def report_sheet_writes(outcomes):
+    for job_id, error in outcomes:
+        if error is None:
+            st.success(f"Updated Google Sheet for Job ID {job_id}")
+        else:
+            st.error(f"Error updating Google Sheet for Job ID {job_id}: {error}")
+
 def get_column_name(df, name):
     cols = [col for col in df.columns if col == name or col.startswith(name + '_')]
     if cols:
@@ -291,47 +289,44 @@ def get_column_name(df, name):
     else:
         return None
 
-def generate_social_content_with_retry(main_content, selected_channels, retries=3, delay=5):
-    generated_content = {}
-    for channel in selected_channels:
-        for i in range(retries):
-            try:
-                prompt = f"{anthropic.HUMAN_PROMPT}Generate a {channel.capitalize()} post based on this content:\n{main_content}\n\n{anthropic.AI_PROMPT}"
-                response = client.completions.create(
-                    prompt=prompt,
-                    model="claude-2",
-                    max_tokens_to_sample=500,
-                    temperature=0.7,
-                )
+def generate_social_post_with_retry(main_content, channel, deadline=None):
+    def on_retry(attempt, e, delay):
+        st.warning(f"API call failed for {channel} ({e}), retrying in {delay:.1f} seconds... (Attempt {attempt + 1} of {RETRY_POLICY.max_attempts})")
 
-                content = response.completion if response.completion else "No content generated."
-                generated_content[channel] = content.strip()
-                break
+    prompt = f"{anthropic.HUMAN_PROMPT}Generate a {channel.capitalize()} post based on this content:\n{main_content}\n\n{anthropic.AI_PROMPT}"
+    try:
+        response = RETRY_POLICY.run(lambda: create_completion(prompt, 500), deadline=deadline, on_retry=on_retry)
+    except Exception as e:
+        st.error(f"Error generating {channel} content: {e}")
+        return ""
 
-            except anthropic.ApiException as e:
-                if 'overloaded' in str(e).lower() and i < retries - 1:
-                    st.warning(f"API is overloaded for {channel}, retrying in {delay} seconds... (Attempt {i + 1} of {retries})")
-                    time.sleep(delay)
-                else:
-                    st.error(f"Error generating {channel} content: {e}")
-        else:
-            generated_content[channel] = ""
-    return generated_content
+    content = response.completion if response.completion else "No content generated."
+    return content.strip()
+
+def generate_social_content_with_retry(main_content, selected_channels, deadline=None):
+    if not selected_channels:
+        return {}
+
+    # Request every channel at once; the worker threads share this session's script context so warnings still render.
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=len(selected_channels), initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        futures = {
+            channel: executor.submit(generate_social_post_with_retry, main_content, channel, deadline)
+            for channel in selected_channels
+        }
+        return {channel: future.result() for channel, future in futures.items()}
 
 def main():
     st.title("AI Script Generator from Google Sheets and Templates")
     st.markdown("---")
 
-    # Load data from the request sheet (input data)
-    if 'sheet_data' not in st.session_state:
-        st.session_state['sheet_data'] = load_google_sheet('1hUX9HPZjbnyrWMc92IytOt4ofYitHRMLSjQyiBpnMK8')
-    if 'examples_data' not in st.session_state:
-        st.session_state['examples_data'] = load_examples()
+    # Load data from the request sheet (input data); after the first run only newly appended rows are fetched
+    st.session_state['sheet_data'] = load_intake_sheet('1hUX9HPZjbnyrWMc92IytOt4ofYitHRMLSjQyiBpnMK8')
+    template_catalog = load_template_catalog(examples_source.version)
 
     sheet_data = st.session_state['sheet_data']
-    examples_data = st.session_state['examples_data']
 
-    if sheet_data.empty or examples_data.empty:
+    if sheet_data.empty or not template_catalog:
         st.error("No data available from Google Sheets or Templates CSV.")
         return
 
@@ -350,6 +345,14 @@ def main():
             st.error("Required columns ('Job ID', 'Selected-Template', 'Topic-Description') not found in the sheet.")
             return
 
+        # The response sheet's header row and Job ID column are read once per run; finished rows
+        # are then written in groups rather than one request per row.
+        try:
+            output_sheet = OutputSheet(open_first_worksheet('1fZs6GMloaw83LoxaX1NYIDr1xHiKtNjyJyn2mKMUvj8'), journal=sheet_write_journal)
+        except Exception as e:
+            st.error(f"Error opening the response Google Sheet: {e}")
+            return
+
         for idx, row in sheet_data.iterrows():
             job_id = row[job_id_col]
             selected_template = row[selected_template_col]
@@ -358,31 +361,27 @@ def main():
             if not (job_id and selected_template and topic_description):
                 st.warning(f"Row {idx + 1} is missing Job ID, Selected-Template, or Topic-Description. Skipping this row.")
                 continue
-            template_structure = extract_template_structure(selected_template, examples_data)
+            template_structure = extract_template_structure(selected_template, template_catalog)
             if template_structure is None:
                 st.warning(f"Template {selected_template} not found in examples data.")
                 continue
 
             # Build a mapping of section names to character limits
-            section_character_limits = {name: max_chars for name, _, max_chars in template_structure}
+            section_character_limits = template_structure.limits
 
             prompt = build_template_prompt(topic_description, template_structure)
 
             if not prompt:
                 continue
 
-            generated_content = generate_content_with_retry(prompt, section_character_limits)
+            # Every model call for this row, including the CTA, shares one deadline
+            deadline = deadline_after(ROW_DEADLINE_SECONDS)
+            generated_content = generate_content_with_retry(prompt, section_character_limits, deadline)
             if generated_content:
-                # Now, divide main sections' content among subsections
-                full_content = generated_content.copy()
-                for main_section in full_content:
-                    # Find subsections
-                    subsections = [s for s, _, _ in template_structure if s.startswith(f"{main_section}-")]
-                    if subsections:
-                        main_content = generated_content[main_section]
-                        # Build subsection character limits
-                        subsection_character_limits = {s: section_character_limits[s] for s in subsections}
-                        divided_contents = divide_content_verbatim(main_content, subsections, subsection_character_limits)
+                # Now, divide main sections' content among subsections, using the groups compiled with the template
+                for main_section, (subsections, subsection_limits) in template_structure.subsection_groups.items():
+                    if main_section in generated_content:
+                        divided_contents = divide_content_verbatim(generated_content[main_section], subsections, subsection_limits)
                         # Add subsections to generated_content
                         generated_content.update(divided_contents)
 
@@ -392,7 +391,7 @@ def main():
                         if 'CTA' in section_name:
                             # Generate CTA content
                             cta_prompt = f"{anthropic.HUMAN_PROMPT}Based on the following description, generate a Call To Action (CTA) that encourages the audience to take the next step. Keep it concise and engaging.\n\nDescription:\n{topic_description}\n\n{anthropic.AI_PROMPT}"
-                            cta_content = generate_content_with_retry(cta_prompt, {section_name: max_chars})
+                            cta_content = generate_content_with_retry(cta_prompt, {section_name: max_chars}, deadline)
                             if cta_content and section_name in cta_content:
                                 generated_content[section_name] = cta_content[section_name]
                             else:
@@ -404,8 +403,13 @@ def main():
                 generated_contents.append((job_id, generated_content))
 
                 # Update the response sheet with generated content
-                update_google_sheet('1fZs6GMloaw83LoxaX1NYIDr1xHiKtNjyJyn2mKMUvj8', job_id, generated_content)
+                update_google_sheet(output_sheet, job_id, generated_content)
+                report_sheet_writes(output_sheet.buffer.drain())
 
+        report_sheet_writes(output_sheet.buffer.close())
+        journal_stats = sheet_write_journal.stats()
+        if journal_stats['pending']:
+            st.caption(f"Write journal: {journal_stats['pending']} rows waiting to be written to Google Sheets; they will be retried in the background.")
         st.session_state['generated_contents'] = generated_contents
 
         for job_id, content in generated_contents:
@@ -442,7 +446,7 @@ def main():
             social_media_contents = []
             for job_id, generated_content in st.session_state['generated_contents']:
                 combined_content = "\n".join([f"{section}: {content}" for section, content in generated_content.items()])
-                social_content_for_row = generate_social_content_with_retry(combined_content, selected_channels)
+                social_content_for_row = generate_social_content_with_retry(combined_content, selected_channels, deadline_after(ROW_DEADLINE_SECONDS))
 
                 if social_content_for_row:
                     social_media_contents.append((job_id, social_content_for_row))
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "run_manifest.sqlite3")
+
+# Stages a row passes through, in order. Rows that cannot be processed at all end as "skipped", and rows
+# a later run took over, or that were completed elsewhere, end as "superseded".
+STAGES = ("pending", "generated", "split", "social_done", "written")
+FINAL_STAGES = ("written", "skipped", "superseded")
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+class RunManifest:
+    """
+    SQLite record of generation runs: which Job IDs each run covers and the stage each one reached,
+    with the content produced so far. An interrupted run can be resumed row by row from its last stage.
+    Thread-safe.
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, options TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS run_rows ("
+            "run_id TEXT NOT NULL, job_id TEXT NOT NULL, stage TEXT NOT NULL, checkpoint TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (run_id, job_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS run_rows_job_id ON run_rows (job_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS run_batches (run_id TEXT NOT NULL, name TEXT NOT NULL, batch_id TEXT NOT NULL, "
+            "PRIMARY KEY (run_id, name))"
+        )
+        self._conn.commit()
+
+    def start_run(self, job_ids, options=None):
+        """
+        Records a new run over job_ids, all pending, and returns it.
+        options holds the settings the run was started with, so a resume can reuse them.
+        Earlier runs' unfinished rows for the same Job IDs are superseded, so they are never resumed over this run's output.
+        """
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        job_ids = [str(job_id) for job_id in job_ids]
+        with self._lock:
+            self._conn.execute("INSERT INTO runs (run_id, options, created_at) VALUES (?, ?, ?)", (run_id, json.dumps(options or {}), now))
+            self._supersede(job_ids, now)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO run_rows (run_id, job_id, stage, updated_at) VALUES (?, ?, 'pending', ?)",
+                [(run_id, job_id, now) for job_id in job_ids]
+            )
+            self._conn.commit()
+        return ManifestRun(self, run_id, options or {}, now)
+
+    def supersede(self, job_ids):
+        """
+        Closes every run's unfinished rows for job_ids, e.g. Job IDs the output sheet already has as complete.
+        """
+        with self._lock:
+            self._supersede([str(job_id) for job_id in job_ids], time.time())
+            self._conn.commit()
+
+    def _supersede(self, job_ids, now):
+        placeholders = ", ".join("?" for _ in FINAL_STAGES)
+        self._conn.executemany(
+            f"UPDATE run_rows SET stage = 'superseded', updated_at = ? WHERE job_id = ? AND stage NOT IN ({placeholders})",
+            [(now, job_id, *FINAL_STAGES) for job_id in job_ids]
+        )
+
+    def latest_unfinished_run(self):
+        """
+        Returns the most recent run with rows not yet written or skipped, or None.
+        """
+        placeholders = ", ".join("?" for _ in FINAL_STAGES)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT runs.run_id, runs.options, runs.created_at FROM runs "
+                "WHERE EXISTS (SELECT 1 FROM run_rows WHERE run_rows.run_id = runs.run_id "
+                f"AND run_rows.stage NOT IN ({placeholders})) "
+                "ORDER BY runs.created_at DESC LIMIT 1",
+                FINAL_STAGES
+            ).fetchone()
+        if row is None:
+            return None
+        return ManifestRun(self, row[0], json.loads(row[1]), row[2])
+
+
+class ManifestRun:
+    """
+    One run in the manifest: per-Job-ID stages and checkpoints.
+    """
+
+    def __init__(self, manifest, run_id, options, created_at):
+        self.manifest = manifest
+        self.run_id = run_id
+        self.options = options
+        self.created_at = created_at
+
+    def stages(self):
+        """
+        Returns a dictionary mapping each Job ID in the run to its stage.
+        """
+        with self.manifest._lock:
+            rows = self.manifest._conn.execute("SELECT job_id, stage FROM run_rows WHERE run_id = ?", (self.run_id,)).fetchall()
+        return dict(rows)
+
+    def unfinished_job_ids(self):
+        return {job_id for job_id, stage in self.stages().items() if stage not in FINAL_STAGES}
+
+    def checkpoint(self, job_id):
+        """
+        Returns (stage, content, social_media_contents) as last recorded for job_id; content and
+        social_media_contents are None when that stage did not produce them.
+        """
+        with self.manifest._lock:
+            row = self.manifest._conn.execute(
+                "SELECT stage, checkpoint FROM run_rows WHERE run_id = ? AND job_id = ?", (self.run_id, str(job_id))
+            ).fetchone()
+        if row is None:
+            return "pending", None, None
+        saved = json.loads(row[1]) if row[1] else {}
+        return row[0], saved.get("content"), saved.get("social")
+
+    def record(self, job_id, stage, content=None, social_media_contents=None):
+        """
+        Moves job_id to stage. The content and social posts given are kept as the checkpoint to resume from;
+        when neither is given the previous checkpoint is kept.
+        """
+        now = time.time()
+        with self.manifest._lock:
+            if content is None and social_media_contents is None:
+                self.manifest._conn.execute(
+                    "INSERT INTO run_rows (run_id, job_id, stage, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (run_id, job_id) DO UPDATE SET stage = excluded.stage, updated_at = excluded.updated_at",
+                    (self.run_id, str(job_id), stage, now)
+                )
+            else:
+                saved = json.dumps({"content": content, "social": social_media_contents}, ensure_ascii=False)
+                self.manifest._conn.execute(
+                    "INSERT OR REPLACE INTO run_rows (run_id, job_id, stage, checkpoint, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.run_id, str(job_id), stage, saved, now)
+                )
+            self.manifest._conn.commit()
+
+
+    def batch_id(self, name):
+        """
+        Returns the id of the Message Batch this run submitted under name and has not collected yet, or None.
+        """
+        with self.manifest._lock:
+            row = self.manifest._conn.execute(
+                "SELECT batch_id FROM run_batches WHERE run_id = ? AND name = ?", (self.run_id, name)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_batch(self, name, batch_id):
+        """
+        Remembers the Message Batch submitted under name, so a resumed run collects it instead of submitting again.
+        A batch_id of None forgets it once its results have been collected.
+        """
+        with self.manifest._lock:
+            if batch_id is None:
+                self.manifest._conn.execute("DELETE FROM run_batches WHERE run_id = ? AND name = ?", (self.run_id, name))
+            else:
+                self.manifest._conn.execute(
+                    "INSERT OR REPLACE INTO run_batches (run_id, name, batch_id) VALUES (?, ?, ?)", (self.run_id, name, batch_id)
+                )
+            self.manifest._conn.commit()
+
+
+def get_run_manifest(path=DEFAULT_MANIFEST_PATH):
+    """
+    Returns the process-wide manifest for path, creating it on first use.
+    """
+    with _manifests_lock:
+        if path not in _manifests:
+            _manifests[path] = RunManifest(path)
+        return _manifests[path]
@@ -3,6 +3,10 @@ import pandas as pd
 import openai
 import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from llm_response_cache import cached_chat_completion, get_response_cache
+from examples_source import get_examples_source
+from template_catalog import canonical_template_id, compile_template_catalog, render_structure
 
 # Add custom CSS to hide the header and toolbar
 st.markdown(
@@ -68,6 +72,9 @@ openai.api_key = st.secrets["openai_api_key"]
 # Create the OpenAI API client
 client = openai
 
+# Cache of model responses keyed by model and prompt
+response_cache = get_response_cache()
+
 # Function to remove emojis and asterisks from text
 def clean_text(text):
     text = re.sub(r'\*\*', '', text)  # Remove asterisks
@@ -83,49 +90,52 @@ def clean_text(text):
     )
     return emoji_pattern.sub(r'', text)
 
-# Load the CSV data from GitHub (Templates CSV)
+# Load the Templates CSV from disk; a newer copy on GitHub is fetched in the background.
+# version identifies the local copy, so a refreshed copy is read again.
+examples_source = get_examples_source()
+
 @st.cache_data
-def load_template_data():
-    url = "https://raw.githubusercontent.com/scooter7/videotemplateselectionform/main/Examples/examples.csv"
+def load_template_data(version):
     try:
-        df = pd.read_csv(url)
+        df = examples_source.read()
         st.write("CSV Data Loaded Successfully")
         return df
     except Exception as e:
         st.error(f"Error loading CSV: {e}")
         return pd.DataFrame()  # Return empty dataframe if failed
 
-template_data = load_template_data()
+# Compiled once per copy of the CSV into a read-only catalog keyed by canonical template id,
+# shared by every session instead of being normalized on each call
+@st.cache_resource
+def load_template_catalog(version):
+    return compile_template_catalog(
+        load_template_data(version),
+        prompt_compiler=render_structure,
+        key=canonical_template_id,
+        exclude_columns=("Description",)
+    )
+
+template_catalog = load_template_catalog(examples_source.version)
 
-# Function to extract text elements from the template CSV and build the OpenAI prompt
-def build_template_prompt(template_number, description, template_data):
-    template_data['Template'] = template_data['Template'].str.strip().str.lower()
-    template_filter = f"template {template_number}".lower()
-    template_row = template_data[template_data['Template'] == template_filter]
+# Function to look up the template in the catalog and build the OpenAI prompt
+def build_template_prompt(template_number, description, template_catalog):
+    template = template_catalog.get(canonical_template_id(f"template {template_number}"))
 
-    if template_row.empty:
+    if template is None:
         return f"No data found for Template {template_number}"
 
     prompt = f"Create content using the following description as the main focus:\n\n'{description}'\n\nUse the following structure and tone for guidance, but do not copy verbatim:\n\n"
-    
-    for col in template_row.columns[2:]:  # Skip the first two columns (Template and Description)
-        text_element = template_row[col].values[0]
-        if pd.notna(text_element):  # Only process non-empty cells
-            prompt += f"{col}: {text_element}\n"
 
-    return prompt
+    # The structure lines were rendered when the catalog was compiled
+    return prompt + template.prompt
 
 # Function to generate content using OpenAI's GPT-4o
-def generate_content(description, template_number, template_data):
-    prompt = build_template_prompt(template_number, description, template_data)
-    completion = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    content = completion.choices[0].message.content.strip()
+def generate_content(description, template_number, template_catalog):
+    prompt = build_template_prompt(template_number, description, template_catalog)
+    content = cached_chat_completion(client, [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]).strip()
     content_clean = clean_text(content)  # Remove asterisks and emojis
     
     # Split the generated content into lines for label association
@@ -157,17 +167,17 @@ def generate_social_content(main_content, selected_channels):
         "instagram": f"Generate an Instagram post based on the following content:\n{main_content}\nUse a tone similar to the posts on https://www.instagram.com/shivehattery/."
     }
 
-    generated_content = {}
-    for channel in selected_channels:
+    # Request every selected channel at once so the wait is the slowest channel, not the sum of all of them
+    def generate_channel_post(channel):
         prompt = social_prompts[channel]
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        generated_content[channel] = clean_text(completion.choices[0].message.content.strip())  # Clean the content
+        content = cached_chat_completion(client, [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ])
+        return clean_text(content.strip())  # Clean the content
+
+    with ThreadPoolExecutor(max_workers=max(len(selected_channels), 1)) as executor:
+        generated_content = dict(zip(selected_channels, executor.map(generate_channel_post, selected_channels)))
     
     return generated_content
 
@@ -191,7 +201,7 @@ def main():
     # Generate main content
     if st.button("Generate Content"):
         if description and template_number:
-            st.session_state['generated_content'] = generate_content(description, template_number, template_data)
+            st.session_state['generated_content'] = generate_content(description, template_number, template_catalog)
             st.text_area("Generated Content", st.session_state['generated_content'], height=300, key="main_content")
             # Add download button for the generated content
             st.download_button(
@@ -256,6 +266,9 @@ def main():
         st.text(revised_content_clean)
         st.download_button("Download Revised Content", revised_content_clean, "revised_content_revision.txt", key="download_revised_content")
 
+    cache_stats = response_cache.stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries stored.")
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
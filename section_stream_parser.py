@@ -0,0 +1,71 @@
+def trim_to_limit(text, limit):
+    """
+    Trims text to at most limit characters, at a word boundary where possible.
+    """
+    if not limit or len(text) <= limit:
+        return text
+    trimmed_content = text[:limit].rsplit(' ', 1)[0] or text[:limit]
+    return trimmed_content.strip()
+
+
+class SectionStreamParser:
+    """
+    Incrementally parses 'Section <name>: <text>' output as it streams in from the model.
+    Each section is emitted, trimmed to its character limit, as soon as the next header
+    (or the end of the stream) shows that its text is complete.
+    """
+
+    def __init__(self, section_character_limits, clean=None):
+        self.section_character_limits = section_character_limits
+        self.clean = clean
+        self.sections = {}
+        self.current_section = None
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """
+        Consumes a chunk of streamed text.
+        Returns a list of (section_name, text) pairs for the sections completed by this chunk.
+        """
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        completed = []
+        for line in lines:
+            self._consume_line(line, completed)
+        return completed
+
+    def close(self):
+        """
+        Flushes the final partial line and returns the sections still open at the end of the stream.
+        """
+        completed = []
+        self._consume_line(self._buffer, completed)
+        self._buffer = ""
+        self._finish_current(completed)
+        return completed
+
+    def _consume_line(self, line, completed):
+        if self.clean:
+            line = self.clean(line)
+        line = line.strip()
+        if line.startswith("Section "):
+            self._finish_current(completed)
+            section_header = line.split(":", 1)
+            if len(section_header) == 2:
+                section_name = section_header[0].replace("Section ", "").strip()
+                section_content = section_header[1].strip()
+            else:
+                section_name = line.replace("Section ", "").strip()
+                section_content = ""
+            self.current_section = section_name
+            self.sections[section_name] = section_content
+        elif self.current_section:
+            self.sections[self.current_section] += ' ' + line
+
+    def _finish_current(self, completed):
+        if self.current_section is None:
+            return
+        section = self.current_section
+        self.sections[section] = trim_to_limit(self.sections[section], self.section_character_limits.get(section, None))
+        completed.append((section, self.sections[section]))
+        self.current_section = None
@@ -0,0 +1,86 @@
+import re
+from collections import defaultdict
+
+import gspread
+import pandas as pd
+
+
+def dedupe_headers(headers):
+    """
+    Renames repeated headers to name_1, name_2, ... so every DataFrame column is unique.
+    """
+    header_counts = defaultdict(int)
+    new_headers = []
+    for h in headers:
+        count = header_counts[h]
+        new_headers.append(f"{h}_{count}" if count > 0 else h)
+        header_counts[h] += 1
+    return new_headers
+
+
+def column_letters(col):
+    """
+    Returns the A1 letters of a 1-based column index, e.g. 81 -> "CC".
+    """
+    return re.sub(r"\d", "", gspread.utils.rowcol_to_a1(1, col))
+
+
+class IncrementalSheetLoader:
+    """
+    Keeps a worksheet's rows as a DataFrame and, after the first full read, fetches only rows appended since.
+    The watermark is the last sheet row loaded together with its key_column value. Each refresh reads from
+    that row onwards; if the row no longer holds the same key, rows were inserted or deleted above it and
+    the sheet is read in full again.
+    """
+
+    def __init__(self, worksheet, key_column="Job ID"):
+        self.worksheet = worksheet
+        self.key_column = key_column
+        self.headers = None
+        self.frame = pd.DataFrame()
+        self.watermark = 0
+        self.watermark_key = None
+        self._key_index = None
+
+    def load(self):
+        """
+        Brings frame up to date with the sheet. Returns the number of rows added to frame.
+        """
+        if self.headers is None:
+            return self._load_all()
+        last_col = column_letters(len(self.headers))
+        rows = self.worksheet.get(f"A{self.watermark}:{last_col}")
+        if not rows or self._key(rows[0]) != self.watermark_key:
+            return self._load_all()
+        new_rows = [self._pad(row) for row in rows[1:]]
+        if not new_rows:
+            return 0
+        new_frame = pd.DataFrame(new_rows, columns=self.frame.columns)
+        self.frame = pd.concat([self.frame, new_frame], ignore_index=True)
+        self.watermark += len(new_rows)
+        self.watermark_key = self._key(new_rows[-1])
+        return len(new_rows)
+
+    def _load_all(self):
+        data = self.worksheet.get_all_values()
+        if not data:
+            self.headers = None
+            self.frame = pd.DataFrame()
+            self.watermark = 0
+            return 0
+        self.headers = data[0]
+        self._key_index = self.headers.index(self.key_column) if self.key_column in self.headers else None
+        rows = [self._pad(row) for row in data[1:]]
+        self.frame = pd.DataFrame(rows, columns=dedupe_headers(self.headers))
+        self.watermark = len(data)
+        self.watermark_key = self._key(data[-1])
+        return len(rows)
+
+    def _pad(self, row):
+        return (list(row) + [""] * len(self.headers))[:len(self.headers)]
+
+    def _key(self, row):
+        # Without a key column every refresh trusts the watermark row.
+        if self._key_index is None:
+            return None
+        return row[self._key_index] if self._key_index < len(row) else ""
@@ -0,0 +1,243 @@
+import threading
+
+import gspread
+
+from sheet_reads import dedupe_headers
+
+# A pending row is sent once this many rows are waiting, or this many seconds after it was queued.
+DEFAULT_MAX_ROWS = 20
+DEFAULT_MAX_SECONDS = 10.0
+# Output rows are identified by the Job ID in this column.
+JOB_ID_COLUMN = 2
+
+
+def job_row(job_id, cells):
+    """
+    Builds the payload for one job's row: its Job ID and (column, value) cells, 1-based columns, in write order.
+    The payload holds no row number; the row is looked up by Job ID when the payload is written.
+    """
+    return {"job_id": str(job_id).strip(), "cells": [[col, value] for col, value in cells]}
+
+
+def locate_job_rows(worksheet, job_ids, header_rows=1):
+    """
+    Reads the Job ID column once and returns a dictionary mapping each of job_ids found there to its row.
+    """
+    wanted = set(job_ids)
+    rows = {}
+    for row, value in enumerate(worksheet.col_values(JOB_ID_COLUMN)[header_rows:], start=header_rows + 1):
+        job_id = str(value).strip()
+        # Keep the first match, as worksheet.find would.
+        if job_id in wanted and job_id not in rows:
+            rows[job_id] = row
+    return rows
+
+
+def append_job_rows(worksheet, job_ids, value_input_option="USER_ENTERED"):
+    """
+    Appends one row per Job ID, holding just the Job ID, after the last row of the sheet.
+    The server places the rows, so sessions appending at the same time never get the same one;
+    the rows are read back from the response. Returns a dictionary mapping each Job ID to its row.
+    """
+    values = [[""] * (JOB_ID_COLUMN - 1) + [job_id] for job_id in job_ids]
+    response = worksheet.append_rows(values, value_input_option=value_input_option, table_range="A1")
+    updated_range = response["updates"]["updatedRange"].rpartition("!")[2]
+    first_row = gspread.utils.a1_range_to_grid_range(updated_range)["startRowIndex"] + 1
+    return {job_id: first_row + i for i, job_id in enumerate(job_ids)}
+
+
+def write_rows(worksheet, rows, value_input_option="USER_ENTERED"):
+    """
+    Writes rows, a list of (key, payload) pairs with payloads built by job_row, to worksheet.
+    Each payload's row is found by its Job ID in the sheet at write time; Job IDs not in the sheet are appended first.
+    The cells then go out in a single values.batchUpdate. If that request fails, the rows are sent one at a time
+    so that each row gets its own error. Returns a list of (key, error) pairs; error is None for rows that were written.
+    """
+    if not rows:
+        return []
+    job_ids = [payload["job_id"] for _, payload in rows]
+    try:
+        placed = locate_job_rows(worksheet, job_ids)
+        missing = [job_id for job_id in dict.fromkeys(job_ids) if job_id not in placed]
+        if missing:
+            placed.update(append_job_rows(worksheet, missing, value_input_option))
+    except Exception as e:
+        return [(key, e) for key, _ in rows]
+    # Ranges are qualified with the worksheet title because the batch update is spreadsheet-wide.
+    quoted_title = worksheet.title.replace("'", "''")
+    def send(batch):
+        data = [
+            {"range": f"'{quoted_title}'!{gspread.utils.rowcol_to_a1(placed[payload['job_id']], col)}", "values": [[value]]}
+            for _, payload in batch
+            for col, value in payload["cells"]
+        ]
+        worksheet.spreadsheet.values_batch_update({"valueInputOption": value_input_option, "data": data})
+    try:
+        send(rows)
+        return [(key, None) for key, _ in rows]
+    except Exception as e:
+        if len(rows) == 1:
+            return [(rows[0][0], e)]
+    outcomes = []
+    for row in rows:
+        try:
+            send([row])
+            outcomes.append((row[0], None))
+        except Exception as row_error:
+            outcomes.append((row[0], row_error))
+    return outcomes
+
+
+class SheetWriteBuffer:
+    """
+    Collects finished rows and sends them to a worksheet with write_rows every max_rows rows or
+    max_seconds seconds, whichever comes first.
+    Each row keeps its own cells in order, so a row's status cell can still be its last cell.
+    Thread-safe. Outcomes are collected per row and handed out by drain().
+    With a journal, each row is recorded there before it is queued and marked done once it is written;
+    rows that fail stay in the journal for its replayer.
+    """
+
+    def __init__(self, worksheet, max_rows=DEFAULT_MAX_ROWS, max_seconds=DEFAULT_MAX_SECONDS, value_input_option="USER_ENTERED", journal=None):
+        self.worksheet = worksheet
+        self.journal = journal
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.value_input_option = value_input_option
+        self._pending = []
+        self._results = []
+        self._timer = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def add(self, key, payload):
+        """
+        Queues one row, a payload built by job_row. key identifies the row in the outcomes returned by drain(),
+        typically its Job ID.
+        """
+        entry_id = None
+        if self.journal:
+            entry_id = self.journal.append(self.worksheet.spreadsheet.id, self.worksheet.title, key, payload)
+        with self._lock:
+            self._pending.append((key, payload, entry_id))
+            full = len(self._pending) >= self.max_rows
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.max_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Sends every queued row now. If the combined request fails, the rows are retried one at a time
+        so that each row gets its own error.
+        """
+        with self._send_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not rows:
+                return
+            outcomes = write_rows(
+                self.worksheet,
+                [(i, payload) for i, (_, payload, _) in enumerate(rows)],
+                self.value_input_option
+            )
+            if self.journal:
+                self.journal.mark_done([rows[i][2] for i, error in outcomes if error is None])
+                for i, error in outcomes:
+                    if error is not None:
+                        self.journal.mark_failed(rows[i][2], error)
+            with self._lock:
+                self._results.extend((rows[i][0], error) for i, error in outcomes)
+
+    def close(self):
+        """
+        Sends anything still queued and returns the outcomes not yet drained.
+        """
+        self.flush()
+        return self.drain()
+
+    def drain(self):
+        """
+        Returns the (key, error) outcome of every row sent since the last call; error is None on success.
+        """
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+
+class JobRowIndex:
+    """
+    Maps the Job IDs in one column of a worksheet to their row numbers, built from a single read of that column.
+    Lookups make no API calls. The index is a snapshot for checking which jobs a sheet already has;
+    it never hands out rows for new Job IDs, because other sessions may be appending to the same sheet.
+    write_rows finds rows again when it writes and lets the server place new ones.
+    """
+
+    def __init__(self, worksheet, column=JOB_ID_COLUMN, header_rows=1):
+        values = worksheet.col_values(column)
+        self.rows = {}
+        for row, value in enumerate(values[header_rows:], start=header_rows + 1):
+            job_id = str(value).strip()
+            # Keep the first match, as worksheet.find would.
+            if job_id and job_id not in self.rows:
+                self.rows[job_id] = row
+
+    def get(self, job_id):
+        """
+        Returns the row number holding job_id, or None if it is not in the sheet.
+        """
+        return self.rows.get(str(job_id).strip())
+
+
+class SheetColumnMap:
+    """
+    Maps section names to worksheet columns, compiled once from the header row.
+    Headers are deduped the same way as when the sheet is loaded into a DataFrame, so a section
+    name matches the DataFrame column of the same name. Names missing from the header row fall back
+    to fallback, a mapping of name to column letters.
+    """
+
+    def __init__(self, worksheet, fallback=None, header_row=1):
+        self.columns = {}
+        for name, letters in (fallback or {}).items():
+            self.columns[name] = gspread.utils.a1_to_rowcol(f"{letters}1")[1]
+        for col, name in enumerate(dedupe_headers(worksheet.row_values(header_row)), start=1):
+            if name:
+                self.columns[name] = col
+
+    def column(self, name):
+        """
+        Returns the 1-based column of name, or None if the sheet has no such column.
+        """
+        return self.columns.get(name)
+
+
+class OutputSheet:
+    """
+    What a run needs to write rows to one worksheet: the column map, read once at its start, the Job ID
+    row index, read the first time it is used, and the write buffer, journaled when a journal is given.
+    Rows for new Job IDs are placed by the server when the buffer writes them, so concurrent sessions never share a row.
+    """
+
+    def __init__(self, worksheet, fallback_columns=None, journal=None):
+        self.worksheet = worksheet
+        self.columns = SheetColumnMap(worksheet, fallback_columns)
+        self.buffer = SheetWriteBuffer(worksheet, journal=journal)
+        self._rows = None
+        self._rows_lock = threading.Lock()
+
+    @property
+    def rows(self):
+        """
+        The JobRowIndex of the worksheet. The buffer finds rows on its own, so runs that never look a row up
+        skip reading the Job ID column.
+        """
+        with self._rows_lock:
+            if self._rows is None:
+                self._rows = JobRowIndex(self.worksheet)
+            return self._rows
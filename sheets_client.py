@@ -0,0 +1,65 @@
+import streamlit as st
+import gspread
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+# Keep-alive connections held open to the Sheets API; sized for the concurrent row writers.
+HTTP_POOL_SIZE = 32
+
+
+# Set by use_sheets_client to route every sheet read and write through another client.
+_client_override = None
+
+
+@st.cache_resource
+def _authorized_client():
+    """
+    Returns the process-wide gspread client, authorized once with the service account credentials.
+    Its session keeps HTTP connections alive between calls and refreshes the access token when it expires.
+    """
+    credentials = Credentials.from_service_account_info(st.secrets["google_credentials"], scopes=SCOPES)
+    session = AuthorizedSession(credentials)
+    session.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+    return gspread.authorize(credentials, session=session)
+
+
+def get_sheets_client():
+    """
+    Returns the client set with use_sheets_client, or else the shared authorized gspread client.
+    """
+    if _client_override is not None:
+        return _client_override
+    return _authorized_client()
+
+
+def use_sheets_client(client):
+    """
+    Makes client, e.g. a fake_gspread.FakeSheetsClient, serve every sheet opened from now on.
+    Passing None goes back to the real Google Sheets client.
+    """
+    global _client_override
+    _client_override = client
+    open_spreadsheet.clear()
+    open_first_worksheet.clear()
+
+
+@st.cache_resource
+def open_spreadsheet(sheet_id):
+    """
+    Returns a Google Sheet, opened once per process with the shared client.
+    """
+    return get_sheets_client().open_by_key(sheet_id)
+
+
+@st.cache_resource
+def open_first_worksheet(sheet_id):
+    """
+    Returns the first worksheet of a Google Sheet, looked up once per process.
+    gspread's sheet1 fetches the spreadsheet's metadata on every access, so the worksheet itself is cached.
+    """
+    return open_spreadsheet(sheet_id).sheet1
@@ -3,6 +3,10 @@ import pandas as pd
 from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
 import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from llm_retry import RetryPolicy, deadline_after
+from examples_source import get_examples_source
+from template_catalog import canonical_template_id, compile_template_catalog, render_structure
 
 # Add custom CSS to hide the header and toolbar
 st.markdown(
@@ -65,8 +69,12 @@ st.markdown('<div class="app-container">', unsafe_allow_html=True)
 # Load Streamlit secrets for API keys
 anthropic_api_key = st.secrets["anthropic_api_key"]
 
-# Create the Anthropic API client
-client = Anthropic(api_key=anthropic_api_key)
+# Create the Anthropic API client; retries are handled by RETRY_POLICY instead of the SDK
+client = Anthropic(api_key=anthropic_api_key, max_retries=0)
+
+# Retry transient API errors with jittered exponential backoff, giving up once a request has run this long
+RETRY_POLICY = RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0)
+REQUEST_DEADLINE_SECONDS = 300
 
 # Function to remove emojis and asterisks from text
 def clean_text(text):
@@ -83,47 +91,57 @@ def clean_text(text):
     )
     return emoji_pattern.sub(r'', text)
 
-# Load the CSV data from GitHub (Templates CSV)
+# Load the Templates CSV from disk; a newer copy on GitHub is fetched in the background.
+# version identifies the local copy, so a refreshed copy is read again.
+examples_source = get_examples_source()
+
 @st.cache_data
-def load_template_data():
-    url = "https://raw.githubusercontent.com/scooter7/videotemplateselectionform/main/Examples/examples.csv"
+def load_template_data(version):
     try:
-        df = pd.read_csv(url)
+        df = examples_source.read()
         st.write("CSV Data Loaded Successfully")
         return df
     except Exception as e:
         st.error(f"Error loading CSV: {e}")
         return pd.DataFrame()  # Return empty dataframe if failed
 
-template_data = load_template_data()
+# Compiled once per copy of the CSV into a read-only catalog keyed by canonical template id,
+# shared by every session instead of being normalized on each call
+@st.cache_resource
+def load_template_catalog(version):
+    return compile_template_catalog(
+        load_template_data(version),
+        prompt_compiler=render_structure,
+        key=canonical_template_id,
+        exclude_columns=("Description",)
+    )
+
+template_catalog = load_template_catalog(examples_source.version)
 
-# Function to extract text elements from the template CSV and build the Anthropic prompt
-def build_template_prompt(template_number, description, template_data):
-    template_data['Template'] = template_data['Template'].str.strip().str.lower()
-    template_filter = f"template {template_number}".lower()
-    template_row = template_data[template_data['Template'] == template_filter]
+# Function to look up the template in the catalog and build the Anthropic prompt
+def build_template_prompt(template_number, description, template_catalog):
+    template = template_catalog.get(canonical_template_id(f"template {template_number}"))
 
-    if template_row.empty:
+    if template is None:
         return f"No data found for Template {template_number}"
 
     prompt = f"Create content based on the following description:\n\n{description}\n\nUse the following structure:\n\n"
-    
-    for col in template_row.columns[2:]:  # Skip the first two columns (Template and Description)
-        text_element = template_row[col].values[0]
-        if pd.notna(text_element):  # Only process non-empty cells
-            prompt += f"{col}: {text_element}\n"
 
-    return prompt
+    # The structure lines were rendered when the catalog was compiled
+    return prompt + template.prompt
 
 # Function to generate content using Anthropic's Claude model
-def generate_content(description, template_number, template_data):
-    prompt = build_template_prompt(template_number, description, template_data)
+def generate_content(description, template_number, template_catalog):
+    prompt = build_template_prompt(template_number, description, template_catalog)
     
     # Make the request to the Anthropic API
-    response = client.messages.create(
-        model="claude-3-5-sonnet-20240620",
-        max_tokens=1024,
-        messages=[{"role": "user", "content": prompt}]
+    response = RETRY_POLICY.run(
+        lambda: client.messages.create(
+            model="claude-3-5-sonnet-20240620",
+            max_tokens=1024,
+            messages=[{"role": "user", "content": prompt}]
+        ),
+        deadline=deadline_after(REQUEST_DEADLINE_SECONDS)
     )
     
     # Print the raw response for debugging purposes
@@ -168,15 +186,22 @@ def generate_social_content(main_content, selected_channels):
         "instagram": f"Generate an Instagram post based on the following content:\n{main_content}\nUse a tone similar to the posts on https://www.instagram.com/shivehattery/."
     }
 
-    generated_content = {}
-    for channel in selected_channels:
+    # Request every selected channel at once so the wait is the slowest channel, not the sum of all of them
+    deadline = deadline_after(REQUEST_DEADLINE_SECONDS)
+    def generate_channel_post(channel):
         prompt = social_prompts[channel]
-        response = client.completions.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=1024,
-            messages=[HUMAN_PROMPT + prompt]
+        response = RETRY_POLICY.run(
+            lambda: client.completions.create(
+                model="claude-3-5-sonnet-20240620",
+                max_tokens=1024,
+                messages=[HUMAN_PROMPT + prompt]
+            ),
+            deadline=deadline
         )
-        generated_content[channel] = clean_text(response['completion'].strip())  # Clean the content
+        return clean_text(response['completion'].strip())  # Clean the content
+
+    with ThreadPoolExecutor(max_workers=max(len(selected_channels), 1)) as executor:
+        generated_content = dict(zip(selected_channels, executor.map(generate_channel_post, selected_channels)))
     
     return generated_content
 
@@ -200,7 +225,7 @@ def main():
     # Generate main content
     if st.button("Generate Content"):
         if description and template_number:
-            st.session_state['generated_content'] = generate_content(description, template_number, template_data)
+            st.session_state['generated_content'] = generate_content(description, template_number, template_catalog)
             st.text_area("Generated Content", st.session_state['generated_content'], height=300, key="main_content")
         else:
             st.error("Please select a template and enter a description.")
@@ -253,10 +278,13 @@ def main():
             HUMAN_PROMPT + pasted_content,
             HUMAN_PROMPT + revision_requests
         ]
-        response = client.completions.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=1024,
-            messages=revision_messages
+        response = RETRY_POLICY.run(
+            lambda: client.completions.create(
+                model="claude-3-5-sonnet-20240620",
+                max_tokens=1024,
+                messages=revision_messages
+            ),
+            deadline=deadline_after(REQUEST_DEADLINE_SECONDS)
         )
         revised_content = response['completion'].strip()
         revised_content_clean = clean_text(revised_content)  # Clean the revised content
@@ -0,0 +1,83 @@
+from types import MappingProxyType
+
+import pandas as pd
+
+
+class TemplateSpec:
+    """
+    Compiled form of one template, built once and shared read-only by every row that uses it.
+    sections is a tuple of (section_name, text_content, max_characters) in template order, and iterating
+    the spec yields them. limits maps each section name to its max characters. subsection_groups maps
+    each section that has subsections (sections named "<section>-...") to a pair of tuples: the subsection
+    names in order and their limits. prompt is whatever prompt_compiler(spec) rendered for the template,
+    or None without a prompt_compiler.
+    """
+
+    __slots__ = ("name", "sections", "limits", "subsection_groups", "prompt")
+
+    def __init__(self, name, sections, prompt_compiler=None):
+        self.name = name
+        self.sections = tuple(sections)
+        self.limits = MappingProxyType({section_name: max_chars for section_name, _, max_chars in self.sections})
+        groups = {}
+        for section_name, _, _ in self.sections:
+            prefix = f"{section_name}-"
+            subsections = tuple(name for name, _, _ in self.sections if name.startswith(prefix))
+            if subsections:
+                groups[section_name] = (subsections, tuple(self.limits[name] for name in subsections))
+        self.subsection_groups = MappingProxyType(groups)
+        self.prompt = prompt_compiler(self) if prompt_compiler else None
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+
+def canonical_template_id(name):
+    """
+    Returns the id a template name is looked up by: trimmed and lower-cased, so "Template 1 " and "template 1" match.
+    """
+    return str(name).strip().lower()
+
+
+def render_structure(spec):
+    """
+    Renders a template's example text as "Section: text" lines, the structure guidance the
+    single-template generators put after the description.
+    """
+    return "".join(f"{section_name}: {text}\n" for section_name, text, _ in spec)
+
+
+def compile_template_catalog(examples_data, max_chars_overrides=None, extra_sections=None, prompt_compiler=None, key=None, exclude_columns=()):
+    """
+    Compiles the examples DataFrame once into a read-only mapping of template name to TemplateSpec.
+    Sections follow the column order, leaving out empty cells and exclude_columns; a section's limit is the
+    length of its example text unless max_chars_overrides names it. extra_sections(template_name), if given,
+    returns sections appended to every template. prompt_compiler(spec), if given, renders the per-template
+    part of the prompt once, stored as spec.prompt. key(template_name), e.g. canonical_template_id, replaces
+    the name as the mapping key. If a template appears on several rows, the first row is used.
+    The catalog and its specs are never modified after compiling, so sessions can share them across threads.
+    """
+    if examples_data.empty or 'Template' not in examples_data.columns:
+        return MappingProxyType({})
+    overrides = max_chars_overrides or {}
+    section_columns = [col for col in examples_data.columns if col != 'Template' and col not in exclude_columns]
+    catalog = {}
+    for values in examples_data[['Template'] + section_columns].itertuples(index=False, name=None):
+        template, texts = values[0], values[1:]
+        if pd.isna(template):
+            continue
+        template_id = key(template) if key else template
+        if template_id in catalog:
+            continue
+        sections = [
+            (col, text, overrides.get(col, len(str(text))))
+            for col, text in zip(section_columns, texts)
+            if pd.notna(text)
+        ]
+        if extra_sections:
+            sections.extend(extra_sections(template))
+        catalog[template_id] = TemplateSpec(template, sections, prompt_compiler)
+    return MappingProxyType(catalog)
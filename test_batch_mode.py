@@ -0,0 +1,75 @@
+import importlib
+import sys
+
+import pandas as pd
+import pytest
+import streamlit
+
+import examples_source
+import llm_response_cache
+import write_journal
+from examples_source import BUNDLED_EXAMPLES_PATH, ExamplesSource
+from fake_gspread import FakeSheetsClient
+from fake_message_batches import FakeMessageBatches
+from sheet_writes import OutputSheet
+
+TEMPLATE = "template_SH_01"
+COLUMNS = ("Job ID", "Selected-Template", "Topic-Description", "Submittee-Name")
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    # The app reads its API key at import; no secrets file is needed with the fake endpoints.
+    monkeypatch.setattr(streamlit, "secrets", {"anthropic": {"anthropic_api_key": "test-key"}})
+    # Everything the app opens at import lives under tmp_path, and no background thread is started:
+    # the examples come from the bundled copy and the journal is never replayed.
+    examples = ExamplesSource(cache_dir=str(tmp_path / "examples"))
+    monkeypatch.setattr(examples_source, "get_examples_source", lambda *args, **kwargs: examples)
+    monkeypatch.setattr(llm_response_cache, "get_response_cache", lambda: llm_response_cache.ResponseCache(str(tmp_path / "responses.sqlite3")))
+    monkeypatch.setattr(write_journal, "get_write_journal", lambda: write_journal.WriteJournal(str(tmp_path / "sheet_writes.sqlite3")))
+    monkeypatch.setattr(write_journal, "start_journal_replayer", lambda *args, **kwargs: None)
+    monkeypatch.delitem(sys.modules, "privategsheetscript", raising=False)
+    return importlib.import_module("privategsheetscript")
+
+
+def output_worksheet(template_catalog):
+    headers = ["Template", "Job ID", "Timestamp", "Submittee"]
+    headers += [name for name, _, _ in template_catalog[TEMPLATE] if name not in headers]
+    headers += ["LinkedIn-Post-Content-Reco", "Facebook-Post-Content-Reco", "Instagram-Post-Content-Reco"]
+    headers += [""] * (80 - len(headers)) + ["Status"]
+    client = FakeSheetsClient(reads_per_minute=None, writes_per_minute=None)
+    return client.add_spreadsheet("output", [headers]).sheet1
+
+
+def test_batch_mode_writes_succeeded_and_cached_rows(app):
+    template_catalog = app.compile_template_catalog(
+        pd.read_csv(BUNDLED_EXAMPLES_PATH), app.SOCIAL_SECTION_MAX_CHARS, app.template_extra_sections, app.compile_template_prompt
+    )
+    intake = pd.DataFrame({
+        "Job ID": ["J-ok", "J-error", "J-cached"],
+        "Selected-Template": [TEMPLATE] * 3,
+        "Topic-Description": ["Hiring architects", "Opening a new office", "Celebrating 100 years"],
+        "Submittee-Name": ["Ana", "Ben", "Cy"]
+    })
+    pending_rows = list(intake.iterrows())
+    # Answer the third row's main request from the response cache.
+    cached_job, _ = app.prepare_row(2, intake.iloc[2], COLUMNS, template_catalog)
+    cached_params = app.message_params(cached_job["prompt"], app.MAIN_MAX_TOKENS)
+    app.response_cache.put(app.cache_key(cached_params), "Section Text01: Cached text\nSection CTA-Text: Cached CTA")
+
+    batches = FakeMessageBatches(fail_custom_ids={"row-1"})
+    worksheet = output_worksheet(template_catalog)
+    output_sheet = OutputSheet(worksheet, app.OUTPUT_COLUMN_FALLBACK)
+    usage = app.start_run_usage()
+    results = app.process_rows_in_batch(pending_rows, COLUMNS, template_catalog, output_sheet, batches)
+    outcomes = output_sheet.buffer.close()
+
+    assert [r["status"] for r in results] == ["generated", "failed", "generated"]
+    main_batch = batches.batches["msgbatch_fake_000001"]["requests"]
+    assert [r["custom_id"] for r in main_batch] == ["row-0", "row-1"]
+    assert results[2]["content"]["Text01"] == "Cached text"
+    assert usage["hits"] == 1
+    assert sorted(outcomes) == [("J-cached", None), ("J-ok", None)]
+    rows = {row[1]: row for row in worksheet.get_all_values()[1:]}
+    assert set(rows) == {"J-ok", "J-cached"}
+    assert all(row[80] == "complete" for row in rows.values())
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sheet_writes import write_rows
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sheet_writes.sqlite3")
+# How often the replayer looks for rows that still have to reach the sheet.
+REPLAY_INTERVAL_SECONDS = 30
+# A row handed to a live write buffer is left alone by the replayer for this long.
+IN_FLIGHT_TIMEOUT_SECONDS = 600
+# Failed rows are retried after 30s, 60s, 120s, ... up to an hour.
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+# Rows written to the sheet are kept this long before being pruned.
+DONE_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+_journals = {}
+_replayers = {}
+_journals_lock = threading.Lock()
+
+
+class WriteJournal:
+    """
+    Durable SQLite log of output rows, appended before anything is sent to the sheet.
+    A row stays pending until it is marked done, so generated content survives a crashed
+    session or a quota stall and can be written later without calling the model again.
+    Thread-safe.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Sync every commit to disk so an appended row survives a crash.
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, spreadsheet_id TEXT NOT NULL, sheet_title TEXT NOT NULL, "
+            "key TEXT NOT NULL, updates TEXT NOT NULL, created_at REAL NOT NULL, done_at REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_pending ON entries (done_at, next_attempt_at)")
+        self._conn.commit()
+
+    def append(self, spreadsheet_id, sheet_title, key, updates):
+        """
+        Records one row, a payload built by sheet_writes.job_row, and returns its entry id.
+        The payload keys the row by Job ID rather than row number, so a replay finds the job's row afresh.
+        The row counts as in flight with the caller.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO entries (spreadsheet_id, sheet_title, key, updates, created_at) VALUES (?, ?, ?, ?, ?)",
+                (spreadsheet_id, sheet_title, str(key), json.dumps(updates, ensure_ascii=False), now)
+            )
+            self._conn.commit()
+            self._in_flight[cursor.lastrowid] = time.monotonic()
+            return cursor.lastrowid
+
+    def mark_done(self, entry_ids):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE entries SET done_at = ?, last_error = NULL WHERE id = ?", [(now, i) for i in entry_ids])
+            self._conn.execute("DELETE FROM entries WHERE done_at IS NOT NULL AND done_at < ?", (now - DONE_RETENTION_SECONDS,))
+            self._conn.commit()
+            for entry_id in entry_ids:
+                self._in_flight.pop(entry_id, None)
+
+    def mark_failed(self, entry_id, error):
+        """
+        Leaves the entry pending and schedules its next attempt with exponential backoff.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            self._conn.execute(
+                "UPDATE entries SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (attempts, now + delay, str(error), entry_id)
+            )
+            self._conn.commit()
+            self._in_flight.pop(entry_id, None)
+
+    def claim_due(self, limit=100):
+        """
+        Returns pending entries that are due for another attempt and not held by a live buffer, marking them in flight.
+        Each entry is a dictionary with id, spreadsheet_id, sheet_title, key and updates, a job_row payload.
+        """
+        now = time.monotonic()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, spreadsheet_id, sheet_title, key, updates FROM entries "
+                "WHERE done_at IS NULL AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+            entries = []
+            for entry_id, spreadsheet_id, sheet_title, key, updates in rows:
+                claimed_at = self._in_flight.get(entry_id)
+                if claimed_at is not None and now - claimed_at < IN_FLIGHT_TIMEOUT_SECONDS:
+                    continue
+                self._in_flight[entry_id] = now
+                entries.append({"id": entry_id, "spreadsheet_id": spreadsheet_id, "sheet_title": sheet_title, "key": key, "updates": json.loads(updates)})
+            return entries
+
+    def stats(self):
+        with self._lock:
+            pending, failing = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(attempts > 0), 0) FROM entries WHERE done_at IS NULL"
+            ).fetchone()
+        return {"pending": pending, "failing": failing}
+
+
+class JournalReplayer:
+    """
+    Background thread that writes pending journal entries to their sheets and marks them done.
+    open_spreadsheet(spreadsheet_id) must return a gspread Spreadsheet. Each entry's row is looked up by
+    its Job ID when it is replayed, so rows handed to other jobs since it was journaled are never overwritten.
+    """
+
+    def __init__(self, journal, open_spreadsheet, interval=REPLAY_INTERVAL_SECONDS, value_input_option="USER_ENTERED"):
+        self.journal = journal
+        self.open_spreadsheet = open_spreadsheet
+        self.interval = interval
+        self.value_input_option = value_input_option
+        self._thread = threading.Thread(target=self._run, name="sheet-write-replayer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def replay_once(self):
+        """
+        Sends every due entry, grouped into one batch update per worksheet. Returns the number written.
+        """
+        groups = {}
+        for entry in self.journal.claim_due():
+            groups.setdefault((entry["spreadsheet_id"], entry["sheet_title"]), []).append(entry)
+        written = 0
+        for (spreadsheet_id, sheet_title), entries in groups.items():
+            try:
+                worksheet = self.open_spreadsheet(spreadsheet_id).worksheet(sheet_title)
+            except Exception as e:
+                for entry in entries:
+                    self.journal.mark_failed(entry["id"], e)
+                continue
+            outcomes = write_rows(worksheet, [(entry["id"], entry["updates"]) for entry in entries], self.value_input_option)
+            done = [entry_id for entry_id, error in outcomes if error is None]
+            self.journal.mark_done(done)
+            for entry_id, error in outcomes:
+                if error is not None:
+                    self.journal.mark_failed(entry_id, error)
+            written += len(done)
+        return written
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.replay_once()
+            except Exception:
+                # The journal keeps everything pending; the next pass tries again.
+                logging.exception("Replaying the sheet write journal failed.")
+
+
+def get_write_journal(path=DEFAULT_JOURNAL_PATH):
+    """
+    Returns the process-wide journal for path, creating it on first use.
+    """
+    with _journals_lock:
+        if path not in _journals:
+            _journals[path] = WriteJournal(path)
+        return _journals[path]
+
+
+def start_journal_replayer(open_spreadsheet, path=DEFAULT_JOURNAL_PATH):
+    """
+    Starts the process-wide replayer for the journal at path, once. Entries left pending by an
+    earlier run or a crashed session are picked up on its first pass.
+    """
+    journal = get_write_journal(path)
+    with _journals_lock:
+        if path not in _replayers:
+            _replayers[path] = JournalReplayer(journal, open_spreadsheet).start()
+        return _replayers[path]